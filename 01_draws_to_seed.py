@@ -19,9 +19,8 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
 import argparse
-import json
 import os
-import re
+import paramfile
 import math
 from datetime import datetime,timedelta
 import gmpy2
@@ -43,7 +42,13 @@ def main():
     parser.add_argument("output_seed_file", help="""JSON file where we can store the seed computed from the draws.""")
     parser.add_argument("entropy_to_gather", help="""Minimum entropy to extract before drawing lone bits.""")
     parser.add_argument("--nbr_lone_bits", type=int, help="""Number of lone bits to extract.""", default=0)
-    
+    parser.add_argument("--format",
+                        choices=paramfile.FORMATS,
+                        help="""Format of the output file: JSON with decimal numbers, JSON with hexadecimal strings, or
+                        binary (default is json). The input file may be in any format.
+                        """,
+                        default="json")
+
     args = parser.parse_args()
 
 
@@ -56,25 +61,30 @@ def main():
 
     # Declare a few important variables
     
-    two_pow_entropy_to_gather = (1<<int(args.entropy_to_gather))
+    entropy_to_gather = int(args.entropy_to_gather)
     
-    seed = 0
-    L = 1 # before lone bits are drawn, seed lies in [0,L - 1]
+    digits = MixedRadixNumber() # before lone bits are drawn, seed lies in [0,L - 1], with L the product of the radices
+    entropy_gathered = False
 
     lone_bits_part = 0
     nbr_lone_bits = args.nbr_lone_bits
 
 
-    # Scan the input file, construct the seed
+    # Scan the input file, construct the seed. Each draw used to extract entropy is a digit of the seed written in mixed
+    # radix, the radix being the number of possible draws.
     
     with open(args.input_draw_file, "r") as f:
         
         for line in f:
 
-            if not line or line.strip() == "" or line.startswith("#"):
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(None, 3)
+            if not fields:
                 continue
 
-            (draw_id, m, n, draw) = re.split("\s+", line.strip(), maxsplit=3)
+            (draw_id, m, n, draw) = fields
+            draw = draw.strip()
 
             if draw == "None":
                 continue
@@ -84,47 +94,95 @@ def main():
             draw = [ int(x) for x in draw.split(",") ]
             index = index_from_draw(draw,m)
 
-            if L < two_pow_entropy_to_gather:
+            if not entropy_gathered:
                 
                 print("Draw %s used to extract entropy"%(draw_id))
-                seed = gmpy2.bincoef(n,m)*seed + index
-                L *= gmpy2.bincoef(n,m)
+                digits.append(index, bincoef(n,m))
+                entropy_gathered = digits.radix_at_least(entropy_to_gather)
                 
             else:
                 
                 print("Draw %s used to extract a lone bit"%(draw_id))
                 b = index & 1
-                seed += L * (b << (args.nbr_lone_bits - nbr_lone_bits))
+                lone_bits_part += b << (args.nbr_lone_bits - nbr_lone_bits)
                 nbr_lone_bits -= 1
 
-            if L >= two_pow_entropy_to_gather and nbr_lone_bits == 0:
+            if entropy_gathered and nbr_lone_bits == 0:
                 break
 
-    if nbr_lone_bits > 0 or L < two_pow_entropy_to_gather:
+    if nbr_lone_bits > 0 or not entropy_gathered:
         utils.exit_error("There wasn't enough draws to collect to request quantity of entropy and lone bits.")
 
+    (seed, L) = digits.value()
+    seed += L * lone_bits_part
+
     seed_upper_bound = L * 2**(args.nbr_lone_bits)
     seed_entropy = math.floor(gmpy2.log2(seed_upper_bound))
     print("The seed contains more than %d bits of entropy (including the %s lone bits)."%(seed_entropy,args.nbr_lone_bits))
-    print("The seed is %d"%(seed))
+    print("The seed is %s"%(seed.digits()))
 
     print("Saving the seed to %s"%(output_seed_file))
-    with open(output_seed_file, "w") as f:
-        json.dump({"seed": int(seed),
-                   "seed_upper_bound": int(seed_upper_bound),
-                   "approx_seed_entropy": int(seed_entropy),
-                   "lone_bits": int(args.nbr_lone_bits)}, 
-                  f,
-                  sort_keys=True)
+    paramfile.save(output_seed_file,
+                   {"seed": int(seed),
+                    "seed_upper_bound": int(seed_upper_bound),
+                    "approx_seed_entropy": int(seed_entropy),
+                    "lone_bits": int(args.nbr_lone_bits)},
+                   args.format)
 
             
 def index_from_draw(draw,m):
     index = 0
     draw = sorted(draw)
     for i in range(m):
-        index += gmpy2.bincoef(draw[i]-1, i+1)
+        index += bincoef(draw[i]-1, i+1)
     return index
 
 
+_bincoef_cache = {}
+
+def bincoef(n, k):
+    """Same as gmpy2.bincoef, with a cache: the draws of an archive share a few values of (n, k)."""
+    try:
+        return _bincoef_cache[(n, k)]
+    except KeyError:
+        c = _bincoef_cache[(n, k)] = gmpy2.bincoef(n, k)
+        return c
+
+
+class MixedRadixNumber:
+    """Integer built by appending digits, in mixed radix, most significant digit first. Appending a digit d of radix r
+    to the number (V, R), of value V in [0, R - 1], gives (V*r + d, R*r). The digits are merged in a product tree, as the
+    carries of a binary counter, so that the cost of n digits is that of O(log n) multiplications of numbers of the final
+    size, instead of n multiplications of a growing number by a small one.
+    """
+
+    def __init__(self):
+        self.stack = [] # (value, radix, number of digits) of consecutive blocks, the first one being the most significant
+
+    def append(self, digit, radix):
+        block = (gmpy2.mpz(digit), gmpy2.mpz(radix), 1)
+        while self.stack and self.stack[-1][2] <= block[2]:
+            (v, r, count) = self.stack.pop()
+            block = (v * block[1] + block[0], r * block[1], count + block[2])
+        self.stack.append(block)
+
+    def radix_at_least(self, bits):
+        """Return True if the product R of the radices is at least 2^bits."""
+        low = sum(gmpy2.bit_length(r) - 1 for (v, r, count) in self.stack)  # 2^low <= R < 2^high
+        high = sum(gmpy2.bit_length(r) for (v, r, count) in self.stack)
+        if low >= bits:
+            return True
+        if high <= bits:
+            return False
+        return self.value()[1] >= gmpy2.mpz(1) << bits
+
+    def value(self):
+        """Return (V, R)."""
+        (V, R) = (gmpy2.mpz(0), gmpy2.mpz(1))
+        for (v, r, count) in self.stack:
+            (V, R) = (V * r + v, R * r)
+        return (V, R)
+
+
 if __name__ == "__main__":
     main()
@@ -19,8 +19,9 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
 import argparse
-import json
 import os
+import paramfile
+import progress
 import subroutines
 import utils
 import math
@@ -44,7 +45,18 @@ def main():
     parser.add_argument("output_file", help="""Output JSON file where this script will write the two generated strong
                                                strong primes "p" and "q". The output file should not exist already.""")
     parser.add_argument("min_prime_bitsize", type=int, help="minimum strong strong prime bit size (e.g. 2048).")
-    
+    parser.add_argument("--status", help="JSON file rewritten with the progress of the search at every report.")
+    parser.add_argument("--progress_interval",
+                        type=int,
+                        help="Number of seconds between two progress reports (default is 60).",
+                        default=60)
+    parser.add_argument("--format",
+                        choices=paramfile.FORMATS,
+                        help="""Format of the output file: JSON with decimal numbers, JSON with hexadecimal strings, or
+                        binary (default is json). The input file may be in any format.
+                        """,
+                        default="json")
+
     args = parser.parse_args()
 
     
@@ -60,8 +72,7 @@ def main():
     min_prime_bitsize = args.min_prime_bitsize
 
     input_file = args.input_file
-    with open(input_file, "r") as f:
-        data = json.load(f)        
+    data = paramfile.load(input_file)
     seed = int(data["seed"])
     seed_upper_bound = int(data["seed_upper_bound"])
     approx_seed_entropy = math.floor(gmpy2.log2(seed_upper_bound))
@@ -106,6 +117,11 @@ def main():
     gamma = [gmpy2.mul(x,y) for x,y in zip(mu,delta)]
 
 
+    # Heuristic probabilities of success of a candidate, for the progress reports
+
+    probabilities = progress.strong_strong_prime_probabilities(min_prime_bitsize, first_primes[-1], PI)
+
+
     # Generate the first strong prime
     
     print("Generating the first strong strong prime...")
@@ -114,7 +130,11 @@ def main():
                                             strong_strong_integers,
                                             number_of_strong_strong_integers,
                                             gamma,
-                                            PI)
+                                            PI,
+                                            progress.Progress("first strong strong prime",
+                                                              probabilities,
+                                                              args.status,
+                                                              args.progress_interval))
     utils.colprint("\tThis is the first strong strong prime:", str(p))
 
     
@@ -126,7 +146,11 @@ def main():
                                             strong_strong_integers,
                                             number_of_strong_strong_integers,
                                             gamma,
-                                            PI)
+                                            PI,
+                                            progress.Progress("second strong strong prime",
+                                                              probabilities,
+                                                              args.status,
+                                                              args.progress_interval))
     utils.colprint("\tThis is the second strong strong prime:", str(q))
 
     
@@ -144,16 +168,16 @@ def main():
     # Save p,q, and s to the output_file
 
     print("Saving p,q, and s0 to %s"%(output_file))
-    with open(output_file, "w") as f:
-        json.dump({"bbs_p": int(p), 
-                   "bbs_q": int(q), 
-                   "bbs_s": int(s0)}, 
-                  f,
-                  sort_keys=True)
+    paramfile.save(output_file,
+                   {"bbs_p": int(p),
+                    "bbs_q": int(q),
+                    "bbs_s": int(s0)},
+                   args.format)
 
 
     
-def generate_strong_strong_prime(seed, min_bitsize,strong_strong_integers,number_of_strong_strong_integers,gamma,PI):
+def generate_strong_strong_prime(seed, min_bitsize,strong_strong_integers,number_of_strong_strong_integers,gamma,PI,
+                                 progress=None):
     """Return a strong strong prime deterministically determined from the input parameters, and what remains of the seed.
 
     Depending on the target prime size "min_bitsize", we need to find the appropriate table of first primes
@@ -169,6 +193,8 @@ def generate_strong_strong_prime(seed, min_bitsize,strong_strong_integers,number
     determine in initial array [c_0,c_1,...,c_{f-1}] and thus an initial candidate c. Going from one such array to the
     other is done deterministically.
 
+    If "progress" is given, each candidate is recorded in this instance of progress.Progress.
+
     """
 
     # Consume the seed and update it
@@ -182,7 +208,15 @@ def generate_strong_strong_prime(seed, min_bitsize,strong_strong_integers,number
         c = sum([x*y for x, y in zip(alpha, gamma)]) % PI
         candidate_nbr += 1
         
-        if gmpy2.bit_length(c) >= min_bitsize-2 and subroutines.is_strong_strong_prime_generator(c):
+        if gmpy2.bit_length(c) < min_bitsize-2:
+            rejected_by = 1
+        elif not subroutines.is_strong_strong_prime_generator(c):
+            rejected_by = 2
+        else:
+            rejected_by = None
+        if progress:
+            progress.record(rejected_by)
+        if rejected_by is None:
             break
 
         indexes = next_indexes(indexes, number_of_strong_strong_integers)
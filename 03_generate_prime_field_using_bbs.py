@@ -20,8 +20,9 @@
 
 import argparse
 import bbsengine
-import json
 import os
+import paramfile
+import progress
 import subroutines
 import utils
 import gmpy2
@@ -39,7 +40,24 @@ def main():
     parser.add_argument("input_file", help="JSON file containing the BBS parameters (typically, the output of 02_generate_bbs_parameters.py).")
     parser.add_argument("output_file", help="Output file where this script will write the prime of the field and the current BBS parameters.")
     parser.add_argument("prime_size", type=int, help="Size of the prime (e.g. 256 bits)")
-    
+    parser.add_argument("--status", help="JSON file rewritten with the progress of the search at every report.")
+    parser.add_argument("--progress_interval",
+                        type=int,
+                        help="Number of seconds between two progress reports (default is 60).",
+                        default=60)
+    parser.add_argument("--exploratory_bbs_bits_per_step",
+                        type=int,
+                        help="""Output this number of bits per squaring of BBS instead of one. The results are then NOT the
+                        canonical ones of MDCurve, and are only meant for exploratory runs; the setting is recorded in the
+                        output file, and followed by 04_generate_curve_using_bbs.py.
+                        """)
+    parser.add_argument("--format",
+                        choices=paramfile.FORMATS,
+                        help="""Format of the output file: JSON with decimal numbers, JSON with hexadecimal strings, or
+                        binary (default is json). The input file may be in any format.
+                        """,
+                        default="json")
+
     args = parser.parse_args()
 
     
@@ -52,12 +70,9 @@ def main():
     size = int(args.prime_size)
 
     input_file = args.input_file
-    with open(input_file, "r") as f:
-        data = json.load(f)        
+    data = paramfile.load(input_file)
     bbs_p = int(data["bbs_p"])
     bbs_q = int(data["bbs_q"])
-    bbs_n = bbs_p * bbs_q
-    bbs_s = int(data["bbs_s"]) % bbs_n
 
     
     # Check inputs
@@ -71,12 +86,17 @@ def main():
         
     # Initialize BBS
 
-    bbs = bbsengine.BBS(bbs_p, bbs_q, bbs_s)
+    try:
+        bbs = bbsengine.from_parameters(data, args.exploratory_bbs_bits_per_step)
+    except ValueError as e:
+        utils.exit_error(str(e))
+    utils.warn_if_not_canonical(bbs)
 
     
     # generate a "size"-bit prime "p"
 
     candidate_nbr = 0
+    search = progress.Progress("prime field", progress.field_prime_probabilities(size), args.status, args.progress_interval)
     print("Generating a prime field Fp (where p is congruent to 3 mod 4)...")
     while True:
         candidate_nbr += 1
@@ -88,7 +108,9 @@ def main():
         assert(p % 4 == 3)
         assert(gmpy2.bit_length(p) == size)
         if subroutines.deterministic_is_pseudo_prime(p):
+            search.record()
             break
+        search.record(1)
     utils.colprint("%d-bit prime found:"%size, str(p))
     utils.colprint("The good candidate was number: ", str(candidate_nbr))
 
@@ -97,13 +119,13 @@ def main():
 
     print("Saving p and the BBS parameters to %s"%(output_file))
     bbs_s = bbs.s
-    with open(output_file, "w") as f:
-        json.dump({"p": int(p), 
-                   "bbs_p": int(bbs_p), 
-                   "bbs_q": int(bbs_q), 
-                   "bbs_s": int(bbs_s)}, 
-                  f,
-                  sort_keys=True)
+    paramfile.save(output_file,
+                   dict({"p": int(p),
+                         "bbs_p": int(bbs_p),
+                         "bbs_q": int(bbs_q),
+                         "bbs_s": int(bbs_s)},
+                        **bbs.mode_parameters()),
+                   args.format)
 
     
 if __name__ == "__main__":
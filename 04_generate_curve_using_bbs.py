@@ -19,11 +19,17 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
 import argparse
+import atexit
 import bbsengine
-import json
+import curvetests
+import edwards
 import os
+import paramfile
+import progress
 import utils
 import subroutines
+import telemetry
+import time
 from datetime import datetime
 import sys
 import gmpy2
@@ -61,6 +67,51 @@ def main():
                         """,
                         default=False,
                         action="store_true")
+    parser.add_argument("--events",
+                        help="""File where this script appends one JSON line per candidate: its number, d, the test that
+                        rejected it, the time spent in each stage and the worker id.
+                        """)
+    parser.add_argument("--worker_id",
+                        help="Identifier of this worker in the events (default is the process id).",
+                        default=str(os.getpid()))
+    parser.add_argument("--quiet",
+                        help="Do not print the candidates and the results of their tests.",
+                        default=False,
+                        action="store_true")
+    parser.add_argument("--status", help="JSON file rewritten with the progress of the search at every report.")
+    parser.add_argument("--progress_interval",
+                        type=int,
+                        help="Number of seconds between two progress reports (default is 60).",
+                        default=60)
+    parser.add_argument("--pari_threads",
+                        type=int,
+                        help="""Number of threads PARI may use inside SEA (requires a libpari built with an MT engine such as
+                        pthread). Default is the setting of PARI.
+                        """)
+    parser.add_argument("--pari_stack",
+                        help="""Initial size of the PARI stack, in bytes, k, M or G (default is %d). With PARI < 2.9, whose
+                        stack cannot grow, the stack has this size or %d bytes if larger.
+                        """%(subroutines.PARI_STACK_SIZE, subroutines.PARI_STACK_SIZE_FIXED))
+    parser.add_argument("--pari_stack_max",
+                        help="""Size the PARI stack may grow to, in bytes, k, M or G (default is %d). The script stops if a
+                        computation needs more.
+                        """%(subroutines.PARI_STACK_SIZE_MAX))
+    parser.add_argument("--pari_stats",
+                        help="""JSON file where this script writes, when it stops, statistics (time, CPU time, stack usage)
+                        on its calls to PARI.
+                        """)
+    parser.add_argument("--exploratory_bbs_bits_per_step",
+                        type=int,
+                        help="""Output this number of bits per squaring of BBS instead of one (by default, the setting
+                        recorded in the input file, if any). The results are then NOT the canonical ones of MDCurve, and
+                        are only meant for exploratory runs; the setting is recorded in the output file.
+                        """)
+    parser.add_argument("--format",
+                        choices=paramfile.FORMATS,
+                        help="""Format of the output file: JSON with decimal numbers, JSON with hexadecimal strings, or
+                        binary (default is json). The input file may be in any format.
+                        """,
+                        default="json")
 
     args = parser.parse_args()
 
@@ -73,17 +124,41 @@ def main():
     if os.path.exists(output_file):
         utils.exit_error("The output file '%s' already exists. Exiting."%(output_file))
 
+    utils.quiet = args.quiet
+    worker_id = args.worker_id
+    events = None
+    if args.events:
+        events = telemetry.EventWriter(args.events)
+        atexit.register(events.close)
+
+    if args.pari_threads is not None:
+        if args.pari_threads < 1:
+            utils.exit_error("The number of PARI threads must be positive.")
+        try:
+            subroutines.set_pari_threads(args.pari_threads)
+        except ValueError as e:
+            utils.exit_error(str(e))
+
+    if args.pari_stack or args.pari_stack_max:
+        try:
+            subroutines.set_pari_stack(utils.parse_size(args.pari_stack or subroutines.PARI_STACK_SIZE),
+                                       utils.parse_size(args.pari_stack_max) if args.pari_stack_max else None)
+        except ValueError as e:
+            utils.exit_error(str(e))
+
+    if args.pari_stats:
+        if os.path.exists(args.pari_stats):
+            utils.exit_error("The file '%s' already exists. Exiting."%(args.pari_stats))
+        subroutines.record_pari_stats(args.pari_stats)
+
     input_file = args.input_file
-    with open(input_file, "r") as f:
-        data = json.load(f)
+    data = paramfile.load(input_file)
 
         
     # Declare a few important variables
         
     bbs_p = int(data["bbs_p"])
     bbs_q = int(data["bbs_q"])
-    bbs_n = bbs_p * bbs_q
-    bbs_s = int(data["bbs_s"]) % bbs_n
     p = int(data["p"])
 
     start = max(int(args.start),1)
@@ -103,7 +178,11 @@ def main():
     # Initialize BBS
 
     print("Initializing BBS...")
-    bbs = bbsengine.BBS(bbs_p, bbs_q, bbs_s)
+    try:
+        bbs = bbsengine.from_parameters(data, args.exploratory_bbs_bits_per_step)
+    except ValueError as e:
+        utils.exit_error(str(e))
+    utils.warn_if_not_canonical(bbs)
 
     
     # Info about the prime field
@@ -119,98 +198,44 @@ def main():
 
 
     # Start looking for "d"
-    
+
+    search = progress.Progress("curve", progress.curve_tests_probabilities(p), args.status, args.progress_interval)
     while True:
         
         if max_nbr_of_tests and candidate_nbr >= start + max_nbr_of_tests - 1:
             print("Did not find an adequate parameter, starting at candidate %d (included), limiting to %d candidates."%(start, max_nbr_of_tests))
+            utils.colprint("Peak size of the PARI stack:", "%d bytes"%(subroutines.pari_stack_peak_size()))
             utils.exit_error("Last candidate checked was number %d."%(candidate_nbr))
 
         candidate_nbr += 1
 
-        bits = bbs.genbits(size)
-        d = 0
-        for bit in bits:
-            d = (d << 1) | bit
-        print("The candidate number %d is d = %d (ellapsed time: %s)"%(candidate_nbr, d, str(datetime.now()-now)))
-
-        
-        # Test 1
-        
-        if not utils.check(d != 0 and d < p, "d != 0 and d < p", 1):
-            continue
-
-        # Test 2
-        
-        if not utils.check(gmpy2.legendre(d, p) == -1, "d is not a square modulo p", 2):
-            continue
-        
-        # Test 3
-        
-        if args.fast:
-            cardinality = subroutines.sea_edwards(1, d, p, 4)
-        else:
-            cardinality = subroutines.sea_edwards(1, d, p)
-        assert(cardinality % 4 == 0)
-        q = cardinality>>2
-        if not utils.check(subroutines.deterministic_is_pseudo_prime(q), "The curve cardinality / 4 is prime", 3):
-            continue
-
-        # Test 4
-        
-        trace = p+1-cardinality
-        cardinality_twist = p+1+trace
-        assert(cardinality_twist % 4 == 0)
-        q_twist = cardinality_twist>>2
-        if not utils.check(subroutines.deterministic_is_pseudo_prime(q_twist), "The twist cardinality / 4 is prime", 4):
-            continue
-        
-        # Test 5
-
-        if not utils.check(q != p and q_twist != p, "Curve and twist are safe against additive transfer", 5):
-            continue
-        
-        # Test 6
-
-        embedding_degree = subroutines.embedding_degree(p, q)
-        if not utils.check(embedding_degree > (q-1) // 100, "Curve is safe against multiplicative transfer", 6):
-            continue
-
-        # Test 7
-
-        embedding_degree_twist = subroutines.embedding_degree(p, q_twist)
-        if not utils.check(embedding_degree_twist > (q_twist-1) // 100, "Twist is safe against multiplicative transfer", 7):
-            continue
-
-        # Test 8
-
-        D = subroutines.cm_field_discriminant(p, trace)
-        if not utils.check(abs(D) >= 2**100, "Absolute value of the discriminant is larger than 2^100", 8):
-            continue
-
-        break
+        t = time.perf_counter()
+        d = bbs.genint(size)
+        bbs_duration = time.perf_counter() - t
+        if not args.quiet:
+            print("The candidate number %d is d = %d (ellapsed time: %s)"%(candidate_nbr, d, str(datetime.now()-now)))
+
+        candidate = telemetry.Candidate(candidate_nbr, d, worker_id)
+        candidate.add_duration("bbs", bbs_duration)
+        with candidate.stage("legendre"):
+            is_non_square = gmpy2.legendre(d, p) == -1
+        result = curvetests.test_candidate(candidate, d, is_non_square, p, args.fast)
+        if events:
+            events.write(candidate.event())
+        search.record(candidate.rejected_by, candidate.durations)
+        if result:
+            break
+
+    (cardinality, cardinality_twist, q, trace, embedding_degree, embedding_degree_twist, D) = result
 
     
     # Find a base point
 
-    while True:
-    
-        bits = bbs.genbits(size)
-        y = 0
-        for bit in bits:
-            y = (y<<1) | bit
-        u = int((1 - y**2) * gmpy2.invert(1 - d*y**2, p)) % p
-        if gmpy2.legendre(u, p) == -1:
-            continue
-        x = gmpy2.powmod(u, (p+1) // 4, p)
-        (x,y) = subroutines.add_on_edwards(x, y, x, y, d, p)
-        (x,y) = subroutines.add_on_edwards(x, y, x, y, d, p)
-        if (x, y) == (0, 1):
-            continue
-
-        assert((x**2 + y**2) % p == (1 + d*x**2*y**2) % p)
-        
-        break
+    (x, y) = subroutines.edwards_base_point_from_bbs(bbs, d, p)
+
+    curve = edwards.EdwardsCurve(d, p)
+    if not utils.check(curve.has_order(curve.point(x, y), q), "the order of the base point"):
+        utils.exit_error("The base point is not of order %d."%(q))
 
     
     # Print some informations
@@ -224,30 +249,31 @@ def main():
     utils.colprint("Discriminant:", "%d"%D)
     utils.colprint("Trace:", "%d"%trace)
     utils.colprint("Base point coordinates:", "(%d, %d)"%(x, y))
+    utils.colprint("Peak size of the PARI stack:", "%d bytes"%(subroutines.pari_stack_peak_size()))
 
     
     # Save p, d, x, y, etc. to the output_file
 
     print("Saving the parameters to %s"%output_file)
     bbs_s = bbs.s
-    with open(output_file, "w") as f:
-        json.dump({"p": int(p),
-                   "bbs_p": int(bbs_p),
-                   "bbs_q": int(bbs_q),
-                   "bbs_s": int(bbs_s),
-                   "candidate_nbr": int(candidate_nbr),
-                   "d": int(d),
-                   "cardinality": cardinality,
-                   "cardinality_twist": cardinality_twist,
-                   "embedding_degree": embedding_degree,
-                   "embedding_degree_twist": embedding_degree_twist,
-                   "discriminant": D,
-                   "trace": trace,
-                   "base_point_x": x,
-                   "base_point_y": y},
-                  f,
-                  sort_keys=True)
+    paramfile.save(output_file,
+                   dict({"p": int(p),
+                         "bbs_p": int(bbs_p),
+                         "bbs_q": int(bbs_q),
+                         "bbs_s": int(bbs_s),
+                         "candidate_nbr": int(candidate_nbr),
+                         "d": int(d),
+                         "cardinality": cardinality,
+                         "cardinality_twist": cardinality_twist,
+                         "embedding_degree": embedding_degree,
+                         "embedding_degree_twist": embedding_degree_twist,
+                         "discriminant": D,
+                         "trace": trace,
+                         "base_point_x": x,
+                         "base_point_y": y},
+                        **bbs.mode_parameters()),
+                   args.format)
+
 
-    
 if __name__ == "__main__":
     main()
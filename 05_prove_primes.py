@@ -20,8 +20,12 @@
 
 import argparse
 import bbsengine
+import certificate
+import concurrent.futures
 import json
 import os
+import paramfile
+import pari_light_interface
 import utils
 import subroutines
 from datetime import datetime
@@ -41,22 +45,110 @@ def main():
                                      output a proof of primality for each of these pseudo primes.
                                      """)
     
-    parser.add_argument("integers", type=int, nargs="+", help="List of all integers to consider.")
+    parser.add_argument("integers",
+                        type=lambda s: int(s, 0),
+                        nargs="*",
+                        help="List of all integers to consider, in decimal or hexadecimal (0x...).")
+    parser.add_argument("--parameters",
+                        action="append",
+                        default=[],
+                        help="""Parameter file written by 02, 03 or 04 (may be repeated). The primes it defines are added
+                        to the integers to consider: p, q and q_twist for a curve, p for a field, and the BBS primes for
+                        the output of 02. The BBS primes being strong strong primes, the known prime factors of p-1 and
+                        (p-1)/2 - 1 are used instead of factoring them.
+                        """)
+    parser.add_argument("--method",
+                        choices=["auto", "pocklington", "ecpp"],
+                        default="auto",
+                        help="""Method of proof of the primes of at least 65 bits. pocklington factors N-1 as much as needed,
+                        which may take very long when N-1 has a large composite cofactor. ecpp proves them with the elliptic
+                        curve certificates of PARI's primecert. auto (the default) uses Pocklington when the quick methods
+                        (known factors, trial division and ECM) factor enough of N-1, and ECPP otherwise.
+                        """)
+    parser.add_argument("--certificate",
+                        help="""File where this script writes a machine-readable certificate of all the proven primes,
+                        which verify_certificate.py checks without factoring. The file should not exist already.
+                        """)
+    parser.add_argument("--store",
+                        help="""Directory of proven primes shared between runs: the primes found there, and thus their whole
+                        proof tree, are not proven again, and the new ones are added to it.
+                        """)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Number of worker processes searching the witnesses (default is the number of cores).")
+    parser.add_argument("--pari_stack",
+                        help="""Initial size of the PARI stack, in bytes, k, M or G (default is %d). With PARI < 2.9, whose
+                        stack cannot grow, the stack has this size or %d bytes if larger.
+                        """%(subroutines.PARI_STACK_SIZE, subroutines.PARI_STACK_SIZE_FIXED))
+    parser.add_argument("--pari_stack_max",
+                        help="""Size the PARI stack may grow to, in bytes, k, M or G (default is %d). The script stops if a
+                        factorization needs more.
+                        """%(subroutines.PARI_STACK_SIZE_MAX))
+    parser.add_argument("--pari_stats",
+                        help="""JSON file where this script writes, when it stops, statistics (time, CPU time, stack usage)
+                        on its calls to PARI.
+                        """)
 
     args = parser.parse_args()
 
+    if args.certificate and os.path.exists(args.certificate):
+        utils.exit_error("The file '%s' already exists. Exiting."%(args.certificate))
+    if args.processes is not None and args.processes < 1:
+        utils.exit_error("The number of processes must be positive.")
+    if args.method == "ecpp" and not pari_light_interface.pari_has_primecert():
+        utils.exit_error("This version of PARI has no primecert, which --method ecpp needs.")
+
+    if args.pari_stack or args.pari_stack_max:
+        try:
+            subroutines.set_pari_stack(utils.parse_size(args.pari_stack or subroutines.PARI_STACK_SIZE),
+                                       utils.parse_size(args.pari_stack_max) if args.pari_stack_max else None)
+        except ValueError as e:
+            utils.exit_error(str(e))
+
+    if args.pari_stats:
+        if os.path.exists(args.pari_stats):
+            utils.exit_error("The file '%s' already exists. Exiting."%(args.pari_stats))
+        subroutines.record_pari_stats(args.pari_stats)
+
+
+    # Read the parameter files
+
+    integers = list(args.integers)
+    known_factors = {} # known_factors[N] is a list of pseudo-prime factors of N - 1
+    for filename in args.parameters:
+        data = paramfile.load(filename)
+        if "cardinality" in data:
+            integers += [data["p"], data["cardinality"] >> 2, data["cardinality_twist"] >> 2]
+        elif "p" in data:
+            integers += [data["p"]]
+        else:
+            integers += [data["bbs_p"], data["bbs_q"]]
+        for N in [data[k] for k in ["bbs_p", "bbs_q"] if k in data]:
+            # N = 4c + 3 with c and 2c + 1 prime: N - 1 = 2 * (2c + 1) and (2c + 1) - 1 = 2 * c. The hints are checked,
+            # since a composite taken for a prime factor of N - 1 would defeat the search of the witnesses
+            if not subroutines.is_strong_strong_prime(N):
+                utils.exit_error("%d, read from %s, is not a strong strong prime."%(N, filename))
+            known_factors[N] = [2, (N-1) // 2]
+            known_factors[(N-1) // 2] = [2, (N-3) // 4]
+    if not integers:
+        utils.exit_error("No integer to consider.")
+
 
     # Check arguments
     
-    for n in args.integers:
+    for n in integers:
         if not subroutines.deterministic_is_pseudo_prime(n):
             utils.exit_error("%d is not prime."%(n))
         
     # Declare a few important variables. In particular, large_factors[p] will contain a list [[p1,m1],[p2,m2],...]  such
     # that p1^m1*p2^m2*... > sqrt(p), for all "p" in "pseudo_primes".
 
-    pseudo_primes = set(args.integers)
+    pseudo_primes = set(integers)
     large_factors = {} 
+    stored_witnesses = {} # stored_witnesses[p] is the list of the witnesses of the proof of p taken from the store
+    ecpp_nodes = {} # ecpp_nodes[p] is the ECPP node of p (as in certificate.py), for the primes proven by ECPP
+    use_ecpp = args.method != "pocklington" and pari_light_interface.pari_has_primecert()
+    store = certificate.Store(args.store) if args.store else None
 
     
     # Compute the dictionnary "large_factors"
@@ -69,16 +161,43 @@ def main():
         p = max(pseudo_primes)
         pseudo_primes.remove(p)
 
-        if p == 2:
+        if p == 2 or p in ecpp_nodes:
+            continue
+
+        node = store.get(p) if store else None
+        if node and certificate.is_ecpp(node):
+            print("Proof of %d found in the store"%(p))
+            ecpp_nodes[p] = node
+            pseudo_primes.update(certificate.children(p, node))
+            continue
+        if node:
+            print("Proof of %d found in the store"%(p))
+            large_factors[p] = [[q,m] for q,m in node["factors"]]
+            stored_witnesses[p] = node["witnesses"]
+            pseudo_primes.update(q for q,m in node["factors"])
+            continue
+
+        if args.method == "ecpp" and p >= subroutines.ECPP_MIN:
+            prove_with_ecpp(p, ecpp_nodes, pseudo_primes)
             continue
         
         print("Factoring %d - 1"%(p))
         
-        all_factors = subroutines.factor(p-1)
+        # Only a factored part F of p-1 with F^2 > p is needed: cheap methods first, the cofactor being left unproven,
+        # then, if they fall short, ECPP or a full factorization
+        (all_factors, cofactor) = subroutines.factor_partially(p-1, p, known_factors.get(p, []))
+        F = 1
+        for q,m in all_factors:
+            F *= q**m
+        if F * F <= p:
+            if use_ecpp and p >= subroutines.ECPP_MIN:
+                prove_with_ecpp(p, ecpp_nodes, pseudo_primes)
+                continue
+            all_factors = sorted(all_factors + subroutines.factor(cofactor))
 
         A = 1
         f = []
-        while A <= math.sqrt(p):
+        while A * A <= p:
             [q,m] = all_factors.pop()
             A *= q**m
             f += [[q,m]]
@@ -86,38 +205,40 @@ def main():
             
         large_factors[p] = list(reversed(f))
 
-    # Prove primes
+    # Prove primes. The witnesses of the generalized Pocklington method are searched concurrently, since the numbers are
+    # independent of each other.
         
     proven_primes = {2: []} # For N > 2, proven_primes[N] will be an array [large_factors[N],a], where proof is a
                             # dictionnary s.t. len(a) == len(large_factors[N]) and a[p] is the a_p corresponding to the
                             # factor p = large_factors[N][p] in the Pocklington method.
 
-    while True:
+    for N, a in stored_witnesses.items():
+        proven_primes[N] = [large_factors[N], {p: a_p for (p,m), a_p in zip(large_factors[N], a)}]
 
-        if not large_factors:
-            break
-
-        N = min(large_factors.keys())
-        # Generalized Pocklington method to show that N is prime
-        f = large_factors.pop(N) # large factors of N - 1
-        a = {}
-        for p,m in f:
-            assert((N-1) % p == 0)
-            for a_p in range(2,N):
-                if gmpy2.powmod(a_p, N-1, N) != 1:
-                    continue
-                if gmpy2.gcd(gmpy2.powmod(a_p, (N-1)//p, N) - 1, N) != 1:
-                    continue
-                break
-            a[p] = a_p
-        proven_primes[N] = [f,a]
+    numbers = sorted(N for N in large_factors.keys() if N not in stored_witnesses)
+    jobs = [(N, large_factors[N]) for N in numbers]
+    processes = args.processes or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        try:
+            for N, a in zip(numbers, executor.map(witnesses, jobs, chunksize=max(1, len(jobs) // (4 * processes)))):
+                proven_primes[N] = [large_factors[N], a]
+                if store:
+                    store.put(N, {"factors": large_factors[N], "witnesses": [a[p] for p,m in large_factors[N]]})
+        except ValueError as e:
+            utils.exit_error(str(e))
+    if store:
+        for N, node in ecpp_nodes.items():
+            store.put(N, node)
 
         
     # Print proofs
 
-    for N in sorted(proven_primes.keys()):
+    for N in sorted(list(proven_primes.keys()) + list(ecpp_nodes.keys())):
         if N == 2:
             continue
+        if N in ecpp_nodes:
+            print_ecpp_proof(N, ecpp_nodes[N])
+            continue
         print("Proof that N = %d is prime:"%(N))
         f = proven_primes[N][0]
         a = proven_primes[N][1]
@@ -130,7 +251,7 @@ def main():
         print("\tA = %d = %s"%(A,factors_to_string(f)))
         print("\tB = %d"%(B))
         assert(gmpy2.gcd(A,B) == 1)
-        assert(A > math.sqrt(N))
+        assert(A * A > N)
         print("\tA and B are relatively prime and A > sqrt(N).")
         print("\tPrime factor(s) of A: %s"%(", ".join([str(p) for p,m in f])))
         for p,m in f:
@@ -138,6 +259,42 @@ def main():
             assert(gmpy2.gcd(gmpy2.powmod(a[p], (N-1) // p, N), N) == 1)
             print("\tFor p = %d, we have %d^(N-1) mod N = 1 and gcd(%d^((N-1)/p) - 1, N) = 1"%(p, a[p], a[p]))
 
+    if args.certificate:
+        print("Saving the certificate to %s"%(args.certificate))
+        proofs = {N: {"factors": proven_primes[N][0], "witnesses": [proven_primes[N][1][p] for p,m in proven_primes[N][0]]}
+                  for N in proven_primes if N != 2}
+        proofs.update(ecpp_nodes)
+        certificate.save(args.certificate, set(integers), proofs)
+
+    utils.colprint("Peak size of the PARI stack:", "%d bytes"%(subroutines.pari_stack_peak_size()))
+
+
+def prove_with_ecpp(p, ecpp_nodes, pseudo_primes):
+    """Add the nodes of the ECPP certificate of p, and the prime its last step relies on to the pseudo primes."""
+    print("Computing an ECPP certificate of %d"%(p))
+    for step in subroutines.ecpp(p):
+        N = step.pop("N")
+        ecpp_nodes[N] = step
+    pseudo_primes.update(certificate.children(N, step))
+
+
+def print_ecpp_proof(N, node):
+    print("Proof that N = %d is prime:"%(N))
+    [q] = certificate.children(N, node)
+    assert(certificate.check_node(N, node))
+    print("\tE: y^2 = x^3 + a*x + b over Z/NZ with a = %d and b = %d"%(node["a"], node["b"]))
+    print("\tm = N + 1 - t = s * q with t = %d, s = %d and q = %d"%(node["t"], node["s"], q))
+    print("\tq > (N^(1/4) + 1)^2 and gcd(4a^3 + 27b^2, N) = 1.")
+    print("\tP = (%d, %d) is on E, [s]P is not O modulo any prime factor of N, and [m]P = O"%(node["x"], node["y"]))
+
+
+def witnesses(job):
+    """Generalized Pocklington method to show that N is prime: return the witness a_p of each large factor p of N-1."""
+    (N, f) = job # f contains the large factors of N - 1
+    for p,m in f:
+        assert((N-1) % p == 0)
+    return subroutines.pocklington_witnesses(N, [p for p,m in f])
+
 
 def factors_to_string(f):
     s = ""
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import threading
+import time
+import bbsengine
+import curvetests
+import edwards
+import subroutines
+import telemetry
+import gmpy2
+
+# Coroutines running the searches of 03 and 04 from an asyncio event loop, so that a service can drive many searches at
+# once. The tests of the candidates (SEA, primality, embedding degrees, discriminant) run in an executor, which must be
+# a process pool or a subroutines.PariThreadPool, since the PARI session of a process cannot be shared by plain threads.
+# BBS, which is cheap and owned by one search, runs in the default executor of the loop. The candidates are tested in
+# the same order as by the scripts, so that the results are the same. A cancelled search (or one whose timeout expires)
+# stops submitting candidates, and the tests already submitted are cancelled if they have not started, discarded
+# otherwise.
+
+BLOCK_SIZE = 64 # Number of candidates generated at once, as the --block_size of 04
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def default_executor():
+    """Return the process pool shared by the searches that are not given an executor, creating it on the first call.
+    Its workers are spawned rather than forked, since the event loop runs in a process which may have other threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                                               mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def shutdown_default_executor(wait=True):
+    """Stop the workers of default_executor(), e.g. when the service stops. A later search creates a new pool."""
+    global _executor
+    with _executor_lock:
+        (executor, _executor) = (_executor, None)
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+async def search_prime_field(params, size, timeout=None, on_event=None, **kwargs):
+    """Search the prime of a size-bit field from the BBS parameters params, as 03_generate_prime_field_using_bbs.py.
+    Return the parameters written by 03 (a dictionary p, bbs_p, bbs_q, bbs_s). Raise asyncio.TimeoutError if the search
+    lasts more than timeout seconds. on_event is called with each event of prime_field_events, whose other keyword
+    arguments are given by kwargs.
+    """
+    return await _search(prime_field_events(params, size, **kwargs), timeout, on_event)
+
+
+async def search_curve(params, timeout=None, on_event=None, **kwargs):
+    """Search an Edwards curve over the field of the parameters params, as 04_generate_curve_using_bbs.py. Return the
+    parameters written by 04, or None if the max_nbr_of_tests candidates were rejected. Raise asyncio.TimeoutError if
+    the search lasts more than timeout seconds. on_event is called with each event of curve_events, whose other keyword
+    arguments are given by kwargs.
+    """
+    return await _search(curve_events(params, **kwargs), timeout, on_event)
+
+
+async def prime_field_events(params, size, executor=None, concurrency=1, block_size=BLOCK_SIZE, worker_id=None,
+                             bits_per_step=None):
+    """Asynchronous iterator of the events of the candidates of search_prime_field: one dictionary per candidate, with
+    the keys of the events of 04 (rejected_by being 1 for a composite candidate). The event of the prime found has a
+    key "result", with the parameters written by 03, and is the last one.
+
+    Keyword arguments:
+    executor    -- process pool or PariThreadPool running the primality tests (default is default_executor())
+    concurrency -- number of blocks of candidates tested at the same time
+    block_size  -- number of candidates per block
+    worker_id   -- worker of the events (default is the process id)
+    bits_per_step -- as --exploratory_bbs_bits_per_step of 03 (default is the setting recorded in params, if any)
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or default_executor()
+    worker_id = worker_id or str(os.getpid())
+    (bbs_p, bbs_q) = (int(params["bbs_p"]), int(params["bbs_q"]))
+    if not await loop.run_in_executor(executor, _are_strong_strong_primes, bbs_p, bbs_q):
+        raise ValueError("bbs_p or bbs_q is not a strong strong prime.")
+    bbs = await loop.run_in_executor(None, _start_bbs, params, bits_per_step, 0)
+
+    async def blocks():
+        while True:
+            block = await loop.run_in_executor(None, _prime_field_block, bbs, size, block_size)
+            yield (block, loop.run_in_executor(executor, _test_prime_field_block, [p for (p, state, duration) in block]))
+
+    candidate_nbr = 0
+    async with contextlib.aclosing(_pipelined(blocks(), concurrency)) as pipeline:
+        async for (block, results) in pipeline:
+            for (p, state, bbs_duration), (is_prime, duration) in zip(block, results):
+                candidate_nbr += 1
+                candidate = telemetry.Candidate(candidate_nbr, p, worker_id)
+                candidate.rejected_by = None if is_prime else 1
+                candidate.add_duration("bbs", bbs_duration)
+                candidate.add_duration("primality", duration)
+                event = candidate.event()
+                if is_prime:
+                    bbs.setstate(state)
+                    event["result"] = dict({"p": int(p), "bbs_p": bbs_p, "bbs_q": bbs_q, "bbs_s": int(bbs.s)},
+                                           **bbs.mode_parameters())
+                yield event
+                if is_prime:
+                    return
+
+
+async def curve_events(params, start=1, max_nbr_of_tests=None, fast=False, executor=None, concurrency=1,
+                       block_size=BLOCK_SIZE, worker_id=None, bits_per_step=None):
+    """Asynchronous iterator of the events of the candidates of search_curve, as written by 04 --events. The event of
+    the successful candidate has a key "result", with the parameters written by 04, and is the last one.
+
+    Keyword arguments:
+    start            -- number of the candidate to start with
+    max_nbr_of_tests -- number of candidates to test before stopping (default is to continue until success)
+    fast             -- early abort of SEA, as 04 --fast
+    executor         -- process pool or PariThreadPool running the tests (default is default_executor())
+    concurrency      -- number of candidates tested at the same time
+    block_size       -- number of candidates generated at once
+    worker_id        -- worker of the events (default is the process id)
+    bits_per_step    -- as --exploratory_bbs_bits_per_step of 04 (default is the setting recorded in params, if any)
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or default_executor()
+    worker_id = worker_id or str(os.getpid())
+    (bbs_p, bbs_q, p) = (int(params["bbs_p"]), int(params["bbs_q"]), int(params["p"]))
+    start = max(start, 1)
+    if not await loop.run_in_executor(executor, _are_strong_strong_primes, bbs_p, bbs_q):
+        raise ValueError("bbs_p or bbs_q is not a strong strong prime.")
+    if not (p % 4 == 3 and await loop.run_in_executor(executor, subroutines.deterministic_is_pseudo_prime, p)):
+        raise ValueError("p is not a prime congruent to 3 modulo 4.")
+    size = gmpy2.bit_length(p)
+    bbs = await loop.run_in_executor(None, _start_bbs, params, bits_per_step, size * (start - 1))
+    end = start + max_nbr_of_tests if max_nbr_of_tests else None
+
+    async def candidates():
+        candidate_nbr = start
+        while end is None or candidate_nbr < end:
+            n = block_size if end is None else min(block_size, end - candidate_nbr)
+            block = await loop.run_in_executor(None, _curve_block, bbs, size, p, n)
+            for (d, state, bbs_duration, is_non_square, legendre_duration) in block:
+                job = (candidate_nbr, d, is_non_square, p, fast, worker_id, bbs_duration, legendre_duration)
+                yield (state, loop.run_in_executor(executor, _test_curve_candidate, job))
+                candidate_nbr += 1
+
+    async with contextlib.aclosing(_pipelined(candidates(), concurrency)) as pipeline:
+        async for (state, (event, result)) in pipeline:
+            if result:
+                event["result"] = await loop.run_in_executor(None, _curve_parameters, bbs, state, event, result,
+                                                             params)
+            yield event
+            if result:
+                return
+
+
+async def _search(events, timeout, on_event):
+    async def run():
+        async with contextlib.aclosing(events):
+            async for event in events:
+                if on_event:
+                    on_event(event)
+                if "result" in event:
+                    return event["result"]
+        return None
+    return await asyncio.wait_for(run(), timeout)
+
+
+async def _pipelined(jobs, concurrency):
+    # Yield (x, result of future) for the pairs (x, future) of the asynchronous iterator jobs, in order, keeping up to
+    # concurrency futures running. The futures left are cancelled, and jobs closed, when the iteration stops: the callers
+    # close this generator with contextlib.aclosing, so that this happens as soon as they stop rather than at its
+    # finalization by the garbage collector.
+    pending = collections.deque()
+    try:
+        async with contextlib.aclosing(jobs):
+            async for (x, future) in jobs:
+                pending.append((x, future))
+                if len(pending) >= concurrency:
+                    (x, future) = pending.popleft()
+                    yield (x, await future)
+            while pending:
+                (x, future) = pending.popleft()
+                yield (x, await future)
+    finally:
+        for (x, future) in pending:
+            future.cancel()
+
+
+def _are_strong_strong_primes(*ps):
+    return all(subroutines.is_strong_strong_prime(p) for p in ps)
+
+
+def _start_bbs(params, bits_per_step, skipped_bits):
+    bbs = bbsengine.from_parameters(params, bits_per_step)
+    bbs.skipbits(skipped_bits)
+    return bbs
+
+
+def _prime_field_block(bbs, size, block_size):
+    # The candidates of 03, with the state of BBS after each of them
+    block = []
+    for i in range(block_size):
+        t = time.perf_counter()
+        p = (1 << (size - 1)) | (bbs.genint(size - 3) << 2) | 3
+        block.append((p, bbs.getstate(), time.perf_counter() - t))
+    return block
+
+
+def _test_prime_field_block(ps):
+    # Primality of the candidates, up to the first prime
+    results = []
+    for p in ps:
+        t = time.perf_counter()
+        is_prime = subroutines.deterministic_is_pseudo_prime(p)
+        results.append((is_prime, time.perf_counter() - t))
+        if is_prime:
+            break
+    return results
+
+
+def _curve_block(bbs, size, p, block_size):
+    # The candidates of 04 and their test 2, as in its main loop
+    ds = []
+    states = []
+    bbs_durations = []
+    for i in range(block_size):
+        t = time.perf_counter()
+        ds.append(bbs.genint(size))
+        states.append(bbs.getstate())
+        bbs_durations.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    survivors = set(subroutines.non_square_candidates(ds, p))
+    legendre_duration = (time.perf_counter() - t) / block_size
+    return [(ds[i], states[i], bbs_durations[i], i in survivors, legendre_duration) for i in range(block_size)]
+
+
+def _test_curve_candidate(job):
+    (candidate_nbr, d, is_non_square, p, fast, worker_id, bbs_duration, legendre_duration) = job
+    candidate = telemetry.Candidate(candidate_nbr, d, worker_id, quiet=True)
+    candidate.add_duration("bbs", bbs_duration)
+    candidate.add_duration("legendre", legendre_duration)
+    result = curvetests.test_candidate(candidate, d, is_non_square, p, fast)
+    return (candidate.event(), result)
+
+
+def _curve_parameters(bbs, state, event, result, params):
+    # The parameters written by 04 for the successful candidate, BBS being rewound to the state following it
+    (cardinality, cardinality_twist, q, trace, embedding_degree, embedding_degree_twist, D) = result
+    (d, p) = (event["d"], int(params["p"]))
+    bbs.setstate(state)
+    (x, y) = subroutines.edwards_base_point_from_bbs(bbs, d, p)
+    curve = edwards.EdwardsCurve(d, p)
+    if not curve.has_order(curve.point(x, y), q):
+        raise ArithmeticError("The base point is not of order %d."%(q))
+    return dict({"p": p,
+                 "bbs_p": int(params["bbs_p"]),
+                 "bbs_q": int(params["bbs_q"]),
+                 "bbs_s": int(bbs.s),
+                 "candidate_nbr": event["candidate"],
+                 "d": d,
+                 "cardinality": cardinality,
+                 "cardinality_twist": cardinality_twist,
+                 "embedding_degree": embedding_degree,
+                 "embedding_degree_twist": embedding_degree_twist,
+                 "discriminant": D,
+                 "trace": trace,
+                 "base_point_x": x,
+                 "base_point_y": y},
+                **bbs.mode_parameters())
@@ -27,7 +27,7 @@ class BBS:
         self.p = p
         self.q = q            
         self.n = p * q
-        power = (2**shift) % ((p-1) * (q-1))
+        power = gmpy2.powmod(2, shift, (p-1) * (q-1))
         self.s = s % self.n
         self.s = gmpy2.powmod(self.s, power, self.n)
 
@@ -41,6 +41,117 @@ class BBS:
             bits.append(self.genbit())
         return bits
 
+    def genint(self, k):
+        """Return the integer whose binary representation, most significant bit first, is made of the next k bits."""
+        x = 0
+        for i in range(k):
+            x = (x << 1) | self.genbit()
+        return x
+
     def skipbits(self,k):
-        power = (2**k) % ((self.p-1) * (self.q-1))
+        power = gmpy2.powmod(2, k, (self.p-1) * (self.q-1))
         self.s = gmpy2.powmod(self.s, power, self.n)
+
+    def getstate(self):
+        """Return the position of the generator, to be given back to setstate()."""
+        return self.s
+
+    def setstate(self, state):
+        self.s = state
+
+    def mode_parameters(self):
+        """Return the parameters, besides bbs_p, bbs_q and bbs_s, that the output files record for this generator."""
+        return {}
+
+
+# Non-canonical extraction of several bits per squaring, for exploratory runs only: the outputs of the MDCurve scripts
+# are defined with one bit per squaring (BBS above). Extracting the j least significant bits of each state is still
+# secure for j = O(log log n) (Vazirani and Vazirani), and MultiBitBBS refuses j > log2(log2(n)).
+
+def max_bits_per_step(n):
+    """Return the largest number of bits per squaring MultiBitBBS accepts for the modulus n."""
+    return gmpy2.bit_length(gmpy2.bit_length(n)) - 1
+
+
+class MultiBitBBS(BBS):
+    """Blum Blum Shub with the "bits_per_step" least significant bits of each state as output, most significant first.
+    Its position is the state s and the number "used" of bits of s already output, so that skipbits and getstate
+    work at the granularity of a bit. With bits_per_step = 1, the output is the one of BBS.
+    """
+
+    def __init__(self, p, q, s, bits_per_step, shift=0, used=None):
+        super().__init__(p, q, s, shift)
+        if not 1 <= bits_per_step <= max_bits_per_step(self.n):
+            raise ValueError("BBS can output 1 to %d bits per squaring with this modulus, not %d"
+                             %(max_bits_per_step(self.n), bits_per_step))
+        self.bits_per_step = bits_per_step
+        self.used = bits_per_step if used is None else used # All the bits of the initial state are considered output
+        if not 0 <= self.used <= bits_per_step:
+            raise ValueError("Invalid number of used bits: %d"%(self.used))
+
+    def genbit(self):
+        return self.genint(1)
+
+    def genbits(self, k):
+        j = self.bits_per_step
+        bits = []
+        while len(bits) < k:
+            if self.used == j:
+                self.s = (self.s**2) % self.n
+                self.used = 0
+            t = min(k - len(bits), j - self.used)
+            x = self.s >> (j - self.used - t)
+            bits += [(x >> i) & 1 for i in range(t - 1, -1, -1)]
+            self.used += t
+        return bits
+
+    def genint(self, k):
+        """Return the integer whose binary representation, most significant bit first, is made of the next k bits."""
+        j = self.bits_per_step
+        x = 0
+        while k > 0:
+            if self.used == j:
+                self.s = (self.s**2) % self.n
+                self.used = 0
+            t = min(k, j - self.used)
+            x = (x << t) | ((self.s >> (j - self.used - t)) & ((1 << t) - 1))
+            self.used += t
+            k -= t
+        return x
+
+    def skipbits(self, k):
+        j = self.bits_per_step
+        if k <= j - self.used:
+            self.used += k
+            return
+        k -= j - self.used
+        steps = (k + j - 1) // j
+        power = gmpy2.powmod(2, steps, (self.p-1) * (self.q-1))
+        self.s = gmpy2.powmod(self.s, power, self.n)
+        self.used = k - (steps - 1) * j
+
+    def getstate(self):
+        return (self.s, self.used)
+
+    def setstate(self, state):
+        (self.s, self.used) = state
+
+    def mode_parameters(self):
+        return {"bbs_bits_per_step": self.bits_per_step, "bbs_bits_used": int(self.used)}
+
+
+def from_parameters(data, bits_per_step=None):
+    """Return the generator at the position recorded in the parameters "data" (as read from the output of 02, 03 or
+    04), in the extraction mode they record, or with bits_per_step bits per squaring if given. A position recorded in a
+    multi-bit mode cannot be switched to another mode.
+    """
+    (p, q) = (int(data["bbs_p"]), int(data["bbs_q"]))
+    s = int(data["bbs_s"]) % (p * q)
+    if "bbs_bits_per_step" in data:
+        if bits_per_step is not None and bits_per_step != data["bbs_bits_per_step"]:
+            raise ValueError("The BBS state was recorded with %d bits per squaring, not %d"
+                             %(data["bbs_bits_per_step"], bits_per_step))
+        return MultiBitBBS(p, q, s, int(data["bbs_bits_per_step"]), used=int(data["bbs_bits_used"]))
+    if bits_per_step is None:
+        return BBS(p, q, s)
+    return MultiBitBBS(p, q, s, bits_per_step)
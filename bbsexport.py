@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+
+import argparse
+import bbsengine
+import concurrent.futures
+import os
+import paramfile
+import struct
+import time
+import utils
+import gmpy2
+
+# An export is a binary file made of a header, the BBS primes p and q and the state s of the input file, all integers
+# being stored big endian on a fixed number of bytes (the size of n = p*q), followed by the output bits of BBS packed
+# eight per byte, most significant bit first, starting at the bit number "start" after the state s (the last byte is
+# padded with zeros). The bits are generated in segments of whole bytes, which worker processes write concurrently at
+# their offset in the file.
+
+MAGIC = b"MDCBBSBS"
+VERSION = 1
+HEADER = struct.Struct(">8sHHHIQQ") # magic, version, bits per squaring, bits of s already output, width of the integers
+                                    # in bytes, start, number of bits
+
+CHUNK_SIZE = 1 << 16 # Number of bytes generated in memory between two writes
+SEGMENT_SIZE = 1 << 23 # Default number of bits of a segment
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export the output of BBS to a file, packed eight bits per byte.")
+    parser.add_argument("input_file", help="""File containing the BBS parameters (typically, the output of
+                                              02_generate_bbs_parameters.py or 03_generate_prime_field_using_bbs.py).""")
+    parser.add_argument("output_file", help="Binary file where the bits are written. The file should not exist already.")
+    parser.add_argument("nbr_of_bits", type=int, help="Number of output bits of BBS to export.")
+    parser.add_argument("--start",
+                        type=int,
+                        help="Number of the first bit exported, counting from 0 at the state of input_file (default is 0).",
+                        default=0)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Number of worker processes generating the segments (default is the number of cores).")
+    parser.add_argument("--segment_size",
+                        type=int,
+                        help="Number of bits generated by a worker process at once, a multiple of 8 (default is %d)."
+                        %(SEGMENT_SIZE),
+                        default=SEGMENT_SIZE)
+
+    args = parser.parse_args()
+
+
+    # Check arguments
+
+    output_file = args.output_file
+    if os.path.exists(output_file):
+        utils.exit_error("The output file '%s' already exists. Exiting."%(output_file))
+    if args.nbr_of_bits < 0 or args.start < 0:
+        utils.exit_error("nbr_of_bits and start must be non negative.")
+    if args.segment_size <= 0 or args.segment_size % 8 != 0:
+        utils.exit_error("The size of the segments must be a positive multiple of 8.")
+    if args.processes is not None and args.processes < 1:
+        utils.exit_error("The number of processes must be positive.")
+
+    data = paramfile.load(args.input_file)
+    try:
+        utils.warn_if_not_canonical(bbsengine.from_parameters(data))
+    except ValueError as e:
+        utils.exit_error(str(e))
+
+
+    # Write the bits
+
+    print("Writing %d bits of BBS to %s..."%(args.nbr_of_bits, output_file))
+    t = time.perf_counter()
+    export(output_file, data, args.start, args.nbr_of_bits, args.processes, args.segment_size)
+    t = time.perf_counter() - t
+    utils.colprint("Total time:", "%.3fs (%.0f bits/s)"%(t, args.nbr_of_bits / t if t > 0 else 0))
+
+
+def export(filename, data, start, nbr_of_bits, processes=None, segment_size=SEGMENT_SIZE):
+    """Write an export of the bits start to start + nbr_of_bits - 1 of BBS from the parameters "data" (bbs_p, bbs_q,
+    bbs_s, and the multi-bit mode if any), the segments of segment_size bits being generated by "processes" workers.
+    """
+    bbs = bbsengine.from_parameters(data)
+    width = (gmpy2.bit_length(bbs.n) + 7) // 8
+    mode = bbs.mode_parameters()
+    header = HEADER.pack(MAGIC, VERSION, mode.get("bbs_bits_per_step", 1), mode.get("bbs_bits_used", 0), width, start,
+                         nbr_of_bits)
+    header += b"".join(int(x).to_bytes(width, "big") for x in [bbs.p, bbs.q, bbs.s])
+    with open(filename, "wb") as f:
+        f.write(header)
+        f.truncate(len(header) + (nbr_of_bits + 7) // 8)
+    jobs = [(filename, len(header), data, start, offset, min(segment_size, nbr_of_bits - offset))
+            for offset in range(0, nbr_of_bits, segment_size)]
+    if not jobs:
+        return
+    if processes == 1 or len(jobs) == 1:
+        for job in jobs:
+            _write_segment(job)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        for _ in executor.map(_write_segment, jobs):
+            pass
+
+
+def read_header(filename):
+    """Return the header of an export as a dictionary: the parameters of BBS (as in the parameter files), start and
+    nbr_of_bits, and the offset of the packed bits in the file.
+    """
+    with open(filename, "rb") as f:
+        content = f.read(HEADER.size)
+        (magic, version, bits_per_step, bits_used, width, start, nbr_of_bits) = HEADER.unpack(content)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a BBS export"%(filename))
+        (p, q, s) = [int.from_bytes(f.read(width), "big") for i in range(3)]
+    header = {"bbs_p": p, "bbs_q": q, "bbs_s": s, "start": start, "nbr_of_bits": nbr_of_bits,
+              "data_offset": HEADER.size + 3 * width}
+    if bits_per_step > 1:
+        header.update({"bbs_bits_per_step": bits_per_step, "bbs_bits_used": bits_used})
+    return header
+
+
+def _write_segment(job):
+    # Generate the bits offset to offset + size - 1 of the export, offset being a multiple of 8, and write them in place
+    (filename, data_offset, data, start, offset, size) = job
+    bbs = bbsengine.from_parameters(data)
+    bbs.skipbits(start + offset)
+    buf = bytearray(CHUNK_SIZE)
+    fd = os.open(filename, os.O_WRONLY)
+    try:
+        position = data_offset + offset // 8
+        while size > 0:
+            k = min(size, 8 * CHUNK_SIZE)
+            n = (k + 7) // 8
+            _pack(bbs, buf, k)
+            os.pwrite(fd, memoryview(buf)[:n], position)
+            position += n
+            size -= k
+    finally:
+        os.close(fd)
+
+
+def _pack(bbs, buf, k):
+    # Write the next k bits of bbs to buf, eight per byte, the last byte being padded with zeros
+    if type(bbs) is not bbsengine.BBS:
+        for i in range(0, k, 8):
+            t = min(8, k - i)
+            buf[i // 8] = bbs.genint(t) << (8 - t)
+        return
+    # One bit per squaring: the loop of BBS.genbit, inlined
+    (s, n) = (bbs.s, bbs.n)
+    for i in range(k // 8):
+        b = 0
+        for j in range(8):
+            s = s * s % n
+            b = (b << 1) | (s & 1)
+        buf[i] = b
+    if k % 8:
+        b = 0
+        for j in range(k % 8):
+            s = s * s % n
+            b = (b << 1) | (s & 1)
+        buf[k // 8] = b << (8 - k % 8)
+    bbs.s = s
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import argparse
+import bbsengine
+import mmap
+import os
+import paramfile
+import struct
+import utils
+import gmpy2
+
+# An index is a binary file made of a header, the modulus n of BBS and the states, all integers being stored big endian
+# on a fixed number of bytes (the size of n). The i-th state is the state of BBS after 2^k * i output bits, starting from
+# the state of the input file (so state 0 is the state of the input file itself). It can be memory-mapped to position
+# BBS at any offset with one lookup and less than 2^k squarings.
+
+MAGIC = b"MDCBBSIX"
+VERSION = 1
+HEADER = struct.Struct(">8sHHIQ") # magic, version, k, width of the integers in bytes, number of states
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Write an index of the states of BBS every 2^k output bits.")
+    parser.add_argument("input_file", help="""JSON file containing the BBS parameters (typically, the output of
+                                              02_generate_bbs_parameters.py or 03_generate_prime_field_using_bbs.py).""")
+    parser.add_argument("output_file", help="Binary file where the index is written. The file should not exist already.")
+    parser.add_argument("log_interval", type=int, help="The index contains one state every 2^log_interval output bits.")
+    parser.add_argument("nbr_of_bits", type=int, help="Number of output bits of BBS covered by the index.")
+
+    args = parser.parse_args()
+
+
+    # Check arguments
+
+    output_file = args.output_file
+    if os.path.exists(output_file):
+        utils.exit_error("The output file '%s' already exists. Exiting."%(output_file))
+    if not 0 <= args.log_interval < 1 << 16:
+        utils.exit_error("log_interval must lie in [0, 2^16).")
+    if args.nbr_of_bits < 0:
+        utils.exit_error("nbr_of_bits must be non negative.")
+
+    data = paramfile.load(args.input_file)
+    if "bbs_bits_per_step" in data:
+        utils.exit_error("Only the canonical output of BBS, one bit per squaring, can be indexed.")
+    bbs_p = int(data["bbs_p"])
+    bbs_q = int(data["bbs_q"])
+    bbs_s = int(data["bbs_s"])
+
+
+    # Write the index
+
+    count = (args.nbr_of_bits >> args.log_interval) + 1
+    print("Writing %d states of BBS to %s..."%(count, output_file))
+    write_index(output_file, bbs_p, bbs_q, bbs_s, args.log_interval, count)
+
+
+def write_index(filename, bbs_p, bbs_q, bbs_s, k, count):
+    """Write "count" states of BBS, one every 2^k output bits, starting from the state bbs_s."""
+    bbs = bbsengine.BBS(bbs_p, bbs_q, bbs_s)
+    width = (gmpy2.bit_length(bbs.n) + 7) // 8
+    interval = 1 << k
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, k, width, count))
+        f.write(int(bbs.n).to_bytes(width, "big"))
+        for i in range(count):
+            if i > 0:
+                if interval < gmpy2.bit_length(bbs.n):
+                    bbs.genbits(interval) # a few squarings are cheaper than a full exponentiation
+                else:
+                    bbs.skipbits(interval)
+            f.write(int(bbs.s).to_bytes(width, "big"))
+
+
+class BBSIndex:
+    """Memory-mapped index of the states of BBS, as written by write_index()."""
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.k, self.width, self.count) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a BBS index"%(filename))
+        if len(self.mm) != HEADER.size + (self.count + 1) * self.width:
+            raise ValueError("%s is truncated"%(filename))
+        self.n = self._integer(0)
+
+    def _integer(self, i):
+        offset = HEADER.size + i * self.width
+        return int.from_bytes(self.mm[offset:offset + self.width], "big")
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def state(self, i):
+        """Return the state of BBS after 2^k * i output bits."""
+        if not 0 <= i < self.count:
+            raise IndexError("state %d is not in the index"%(i))
+        return self._integer(i + 1)
+
+    def bbs_at(self, bbs_p, bbs_q, offset):
+        """Return an instance of BBS that outputs the bits starting at bit number "offset" (counting from 0)."""
+        if bbs_p * bbs_q != self.n:
+            raise ValueError("The index was computed for another BBS modulus")
+        i = min(offset >> self.k, self.count - 1)
+        bbs = bbsengine.BBS(bbs_p, bbs_q, self.state(i))
+        r = offset - (i << self.k)
+        if r < gmpy2.bit_length(self.n):
+            bbs.genbits(r)
+        else:
+            bbs.skipbits(r)
+        return bbs
+
+
+if __name__ == "__main__":
+    main()
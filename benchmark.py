@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import argparse
+import bbsengine
+import bbsexport
+import json
+import multiprocessing
+import os
+import platform
+import pointcount
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import subroutines
+import utils
+import gmpy2
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="""Measure the performance of the hot paths of the scripts. Every
+                                     benchmark is deterministic: the random inputs of a measurement are drawn from the
+                                     seed and the name of the measurement, whatever the benchmarks run before.""")
+    parser.add_argument("--json", help="JSON file where the measurements are written (it can be used as a baseline).")
+    parser.add_argument("--baseline",
+                        help="""JSON file written by a previous run with --json. Each measurement is compared with the
+                        baseline, and the script fails if one of them regressed by more than the tolerance.
+                        """)
+    parser.add_argument("--tolerance",
+                        type=float,
+                        help="Relative slowdown tolerated before reporting a regression (default is 0.2).",
+                        default=0.2)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the (non cryptographic) random inputs.")
+    parser.add_argument("--runs",
+                        type=int,
+                        help="Each measurement is the median of this number of runs on the same inputs (default is 3).",
+                        default=3)
+    subparsers = parser.add_subparsers(dest="benchmark")
+
+    p = subparsers.add_parser("all", help="Run all the benchmarks below, except pari_threads, with their default settings.")
+    p.add_argument("--quick",
+                   help="Use the smallest sizes only, to check quickly that nothing broke.",
+                   default=False,
+                   action="store_true")
+    p.set_defaults(func=bench_all)
+
+    p = subparsers.add_parser("bbs", help="Throughput of BBS.genbits for several sizes of the modulus.")
+    p.add_argument("--sizes", default="1024,2048,4096", help="Comma separated sizes of the modulus (default is 1024,2048,4096).")
+    p.add_argument("--nbr_of_bits", type=int, default=20000, help="Number of bits generated per size (default is 20000).")
+    p.add_argument("--bits_per_step", type=int, default=1,
+                   help="Bits output per squaring, with the non-canonical MultiBitBBS if > 1 (default is 1).")
+    p.set_defaults(func=bench_bbs)
+
+    p = subparsers.add_parser("export", help="Throughput of bbsexport.export, packing the bits to a temporary file.")
+    p.add_argument("--size", type=int, default=4096, help="Size of the modulus (default is 4096).")
+    p.add_argument("--nbr_of_bits", type=int, default=200000, help="Number of bits exported (default is 200000).")
+    p.add_argument("--processes", default="1", help="Comma separated numbers of worker processes (default is 1).")
+    p.set_defaults(func=bench_export)
+
+    p = subparsers.add_parser("skipbits", help="Latency of BBS.skipbits(k) for several k, with a 4096-bit modulus.")
+    p.add_argument("--size", type=int, default=4096, help="Size of the modulus (default is 4096).")
+    p.add_argument("--log_k", default="8,16,32,64", help="Comma separated values of log2(k) (default is 8,16,32,64).")
+    p.set_defaults(func=bench_skipbits)
+
+    p = subparsers.add_parser("primality", help="Latency of deterministic_is_pseudo_prime on primes of several sizes.")
+    p.add_argument("--sizes", default="128,256,512,2048", help="Comma separated sizes (default is 128,256,512,2048).")
+    p.add_argument("--repeat", type=int, default=5, help="Number of primes per size (default is 5).")
+    p.set_defaults(func=bench_primality)
+
+    p = subparsers.add_parser("sea", help="Latency of sea_edwards, with and without early abort, for several field sizes.")
+    p.add_argument("--sizes", default="128,192,256", help="Comma separated field sizes (default is 128,192,256, 384 is slow).")
+    p.add_argument("--candidates", type=int, default=3, help="Number of candidates per size (default is 3).")
+    p.set_defaults(func=bench_sea)
+
+    p = subparsers.add_parser("small_sea",
+                              help="""Compare the point counting in Python used below subroutines.SMALL_FIELD_LIMIT with
+                              SEA in PARI on small fields, and check that both agree.""")
+    p.add_argument("--sizes", default="16,32,48,64", help="Comma separated field sizes (default is 16,32,48,64).")
+    p.add_argument("--candidates", type=int, default=10, help="Number of candidates per size (default is 10).")
+    p.set_defaults(func=bench_small_sea)
+
+    p = subparsers.add_parser("factor", help="Latency of factor(q-1) for random primes q of several sizes.")
+    p.add_argument("--sizes", default="128,192,256", help="Comma separated sizes (default is 128,192,256).")
+    p.add_argument("--repeat", type=int, default=3, help="Number of values per size (default is 3).")
+    p.set_defaults(func=bench_factor)
+
+    p = subparsers.add_parser("strong_strong_candidates",
+                              help="""Rate at which 02_generate_bbs_parameters.py tests candidates c (c, 2c+1 and 4c+3
+                              coprime to the small primes) for several prime sizes.""")
+    p.add_argument("--sizes", default="512,1024,2048", help="Comma separated prime sizes (default is 512,1024,2048).")
+    p.add_argument("--candidates", type=int, default=200, help="Number of candidates per size (default is 200).")
+    p.set_defaults(func=bench_strong_strong_candidates)
+
+    p = subparsers.add_parser("proof", help="Time of 05_prove_primes.py on random primes of several sizes.")
+    p.add_argument("--sizes", default="128,256", help="Comma separated sizes (default is 128,256).")
+    p.add_argument("--method", choices=["auto", "pocklington", "ecpp"], default="auto",
+                   help="Method of proof given to 05_prove_primes.py (default is auto).")
+    p.set_defaults(func=bench_proof)
+
+    p = subparsers.add_parser("legendre",
+                              help="""Compare the throughput of the tests 1 and 2 of 04_generate_curve_using_bbs.py done
+                              candidate by candidate and by blocks, and check that both agree.""")
+    p.add_argument("--bits", type=int, default=256, help="Size of the prime field (default is 256).")
+    p.add_argument("--block_size", type=int, default=64, help="Number of candidates per block (default is 64).")
+    p.add_argument("--candidates", type=int, default=100000, help="Number of candidates (default is 100000).")
+    p.set_defaults(func=bench_legendre)
+
+    p = subparsers.add_parser("pari_threads",
+                              help="""Compare the latency of SEA on one candidate using n PARI threads with the throughput
+                              of n single-threaded processes each handling its own candidate, and of a
+                              subroutines.PariThreadPool of n threads.""")
+    p.add_argument("--bits", type=int, default=192, help="Size of the prime field (default is 192).")
+    p.add_argument("--threads", default="1,2,4", help="Comma separated list of thread counts (default is 1,2,4).")
+    p.add_argument("--candidates", type=int, default=4, help="Number of candidates d per measure (default is 4).")
+    p.set_defaults(func=bench_pari_threads)
+
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.error("a benchmark must be chosen")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    if args.runs < 1:
+        utils.exit_error("The number of runs must be positive.")
+
+    measurements = args.func(args, args.seed)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": args.benchmark,
+                       "python": platform.python_version(),
+                       "gmpy2": gmpy2.version(),
+                       "measurements": measurements},
+                      f,
+                      indent=2,
+                      sort_keys=True)
+
+    if args.baseline:
+        regressions = compare_with_baseline(measurements, baseline["measurements"], args.tolerance)
+        if regressions:
+            utils.exit_error("%d measurement(s) regressed by more than %d%%."%(regressions, 100 * args.tolerance))
+
+
+def measurement(name, value, unit, higher_is_better):
+    """Print and return a measurement. higher_is_better tells whether value is a throughput or a latency."""
+    utils.colprint("%s:"%(name), "%.6g %s"%(value, unit))
+    return {"name": name, "value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def compare_with_baseline(measurements, baseline, tolerance):
+    """Print the comparison of the measurements with the baseline, and return the number of regressions."""
+    baseline = {m["name"]: m for m in baseline}
+    regressions = 0
+    print("Comparison with the baseline:")
+    for m in measurements:
+        if m["name"] not in baseline:
+            continue
+        b = baseline[m["name"]]["value"]
+        speedup = m["value"] / b if m["higher_is_better"] else b / m["value"]
+        status = ""
+        if speedup < 1 / (1 + tolerance):
+            status = " REGRESSION"
+            regressions += 1
+        utils.colprint("\t%s:"%(m["name"]), "x%.3f%s"%(speedup, status))
+    return regressions
+
+
+def sizes(s):
+    return [int(x) for x in s.split(",")]
+
+
+def random_inputs(seed, name):
+    """Return the generator of the random inputs of the measurement "name", which only depends on seed and name."""
+    return random.Random("%d/%s"%(seed, name))
+
+
+def median_time(f, runs):
+    """Return the median of the wall times of runs calls to f()."""
+    times = []
+    for i in range(runs):
+        t = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t)
+    return statistics.median(times)
+
+
+def random_prime(bits, rng, residue=1, modulus=2):
+    """Return a pseudo random prime of "bits" bits, congruent to residue modulo modulus."""
+    while True:
+        p = rng.getrandbits(bits) | (1 << (bits-1))
+        p += (residue - p) % modulus
+        if gmpy2.bit_length(p) == bits and gmpy2.is_prime(p):
+            return p
+
+
+def random_field_prime(bits, rng):
+    """Return a pseudo random prime of "bits" bits, congruent to 3 modulo 4."""
+    return random_prime(bits, rng, 3, 4)
+
+
+def random_non_squares(p, k, rng):
+    """Return k pseudo random candidates d that pass the tests 1 and 2 of 04_generate_curve_using_bbs.py."""
+    ds = []
+    while len(ds) < k:
+        d = rng.randrange(1, p)
+        if gmpy2.legendre(d, p) == -1:
+            ds.append(d)
+    return ds
+
+
+def random_bbs(size, rng):
+    """Return an instance of BBS with a "size"-bit modulus. The primes are Blum primes, but not strong strong primes, which
+    does not change the cost of BBS and is much faster to generate."""
+    p = random_prime(size // 2, rng, 3, 4)
+    q = random_prime(size - size // 2, rng, 3, 4)
+    return bbsengine.BBS(p, q, rng.getrandbits(size))
+
+
+def bench_all(args, seed):
+    quick = args.quick
+
+    def settings(**kwargs):
+        return argparse.Namespace(runs=args.runs, **kwargs)
+
+    measurements = []
+    measurements += bench_bbs(settings(sizes="1024" if quick else "1024,2048,4096", nbr_of_bits=20000,
+                                       bits_per_step=1), seed)
+    measurements += bench_skipbits(settings(size=4096, log_k="8,64" if quick else "8,16,32,64"), seed)
+    measurements += bench_primality(settings(sizes="128,256" if quick else "128,256,512,2048", repeat=5), seed)
+    measurements += bench_sea(settings(sizes="128" if quick else "128,192,256", candidates=3), seed)
+    measurements += bench_small_sea(settings(sizes="32,64" if quick else "16,32,48,64", candidates=10), seed)
+    measurements += bench_factor(settings(sizes="128" if quick else "128,192,256", repeat=3), seed)
+    measurements += bench_strong_strong_candidates(settings(sizes="512" if quick else "512,1024,2048", candidates=200),
+                                                   seed)
+    measurements += bench_proof(settings(sizes="128" if quick else "128,256", method="auto"), seed)
+    measurements += bench_legendre(settings(bits=256, block_size=64, candidates=100000), seed)
+    return measurements
+
+
+def bench_bbs(args, seed):
+    measurements = []
+    for size in sizes(args.sizes):
+        name = "bbs.genbits/%d"%(size)
+        bbs = random_bbs(size, random_inputs(seed, name))
+        if args.bits_per_step > 1:
+            bbs = bbsengine.MultiBitBBS(bbs.p, bbs.q, bbs.s, args.bits_per_step)
+            name = "multibitbbs.genbits/%d/%d"%(size, args.bits_per_step)
+        t = median_time(lambda: bbs.genbits(args.nbr_of_bits), args.runs)
+        measurements.append(measurement(name, args.nbr_of_bits / t, "bits/s", True))
+    return measurements
+
+
+def bench_export(args, seed):
+    measurements = []
+    bbs = random_bbs(args.size, random_inputs(seed, "bbsexport/%d"%(args.size)))
+    data = {"bbs_p": bbs.p, "bbs_q": bbs.q, "bbs_s": bbs.s}
+    with tempfile.TemporaryDirectory() as directory:
+        for processes in sizes(args.processes):
+            filename = os.path.join(directory, "export%d"%(processes))
+            segment_size = max(8, (args.nbr_of_bits // (4 * processes)) & ~7)
+            t = median_time(lambda: bbsexport.export(filename, data, 0, args.nbr_of_bits, processes, segment_size),
+                            args.runs)
+            measurements.append(measurement("bbsexport/%d/%d"%(args.size, processes), args.nbr_of_bits / t, "bits/s", True))
+    return measurements
+
+
+def bench_skipbits(args, seed):
+    measurements = []
+    bbs = random_bbs(args.size, random_inputs(seed, "bbs.skipbits/%d"%(args.size)))
+    for log_k in sizes(args.log_k):
+        t = median_time(lambda: bbs.skipbits(1 << log_k), args.runs)
+        measurements.append(measurement("bbs.skipbits/%d/2^%d"%(args.size, log_k), t, "s", False))
+    return measurements
+
+
+def bench_primality(args, seed):
+    measurements = []
+    for size in sizes(args.sizes):
+        name = "deterministic_is_pseudo_prime/%d"%(size)
+        rng = random_inputs(seed, name)
+        primes = [random_prime(size, rng) for i in range(args.repeat)]
+        t = median_time(lambda: [subroutines.deterministic_is_pseudo_prime(p) for p in primes], args.runs)
+        measurements.append(measurement(name, t / len(primes), "s", False))
+    return measurements
+
+
+def bench_sea(args, seed):
+    measurements = []
+    for size in sizes(args.sizes):
+        rng = random_inputs(seed, "sea_edwards/%d"%(size))
+        p = random_field_prime(size, rng)
+        ds = random_non_squares(p, args.candidates, rng)
+        for (s, variant) in [(0, "full"), (4, "early_abort")]:
+            t = median_time(lambda: [subroutines.sea_edwards(1, d, p, s) for d in ds], args.runs)
+            measurements.append(measurement("sea_edwards/%d/%s"%(size, variant), t / len(ds), "s", False))
+    return measurements
+
+
+def check_bsgs_two_torsion(rng):
+    """Check pointcount._bsgs against a naive search of the multiples of the order, for a point Q of order exactly 2m, m
+    being its number of baby steps: m*Q is then of order 2, and a giant step landing on it is followed by two multiples."""
+    p = random_field_prime(12, rng)
+    w = gmpy2.isqrt(4*p)
+    (low, high) = (p + 1 - w, p + 1 + w)
+    m = int(gmpy2.isqrt((high - low) // 2)) + 1
+    while True:
+        (a, b) = (rng.randrange(p), rng.randrange(p))
+        if (4*a**3 + 27*b**2) % p == 0:
+            continue
+        n = p + 1 + sum(gmpy2.legendre(x**3 + a*x + b, p) for x in range(p))
+        if n % (2*m) != 0:
+            continue
+        x = rng.randrange(p)
+        while gmpy2.legendre(x**3 + a*x + b, p) != 1:
+            x = (x + 1) % p
+        Q = pointcount._mul(n // (2*m), (x, pointcount.sqrt_mod(x**3 + a*x + b, p)), a, p)
+        (R, order) = (Q, 1)
+        while R is not None:
+            (R, order) = (pointcount._add(R, Q, a, p), order + 1)
+        if order == 2*m:
+            break
+    expected = [k for k in range(low, high + 1) if k % order == 0]
+    if sorted(pointcount._bsgs(Q, low, high, a, p)) != expected:
+        utils.exit_error("The baby steps, giant steps miss multiples of the order of a point of order %d."%(order))
+
+
+def bench_small_sea(args, seed):
+    check_bsgs_two_torsion(random_inputs(seed, "small_sea/bsgs"))
+    measurements = []
+    limit = subroutines.SMALL_FIELD_LIMIT
+    for size in sizes(args.sizes):
+        rng = random_inputs(seed, "small_sea/%d"%(size))
+        p = random_field_prime(size, rng)
+        ds = random_non_squares(p, args.candidates, rng)
+        results = {}
+        for (variant, small_field_limit) in [("python", limit), ("pari", 0)]:
+            subroutines.SMALL_FIELD_LIMIT = small_field_limit
+            results[variant] = [subroutines.sea_edwards(1, d, p) for d in ds]
+            t = median_time(lambda: [subroutines.sea_edwards(1, d, p) for d in ds], args.runs)
+            measurements.append(measurement("small_sea/%d/%s"%(size, variant), t / len(ds), "s", False))
+        subroutines.SMALL_FIELD_LIMIT = limit
+        if results["python"] != results["pari"]:
+            utils.exit_error("The point counting in Python and SEA disagree over a %d-bit field."%(size))
+    return measurements
+
+
+def bench_factor(args, seed):
+    measurements = []
+    for size in sizes(args.sizes):
+        name = "factor/%d"%(size)
+        rng = random_inputs(seed, name)
+        values = [random_prime(size, rng) - 1 for i in range(args.repeat)]
+        t = median_time(lambda: [subroutines.factor(n) for n in values], args.runs)
+        measurements.append(measurement(name, t / len(values), "s", False))
+    return measurements
+
+
+def bench_strong_strong_candidates(args, seed):
+    measurements = []
+    small_primes = subroutines.FIRST_PRIMES[:64]
+    for size in sizes(args.sizes):
+        name = "strong_strong_candidates/%d"%(size)
+        rng = random_inputs(seed, name)
+        candidates = []
+        while len(candidates) < args.candidates:
+            c = rng.getrandbits(size - 2) | (1 << (size - 3))
+            if all(c % l and (2*c + 1) % l and (4*c + 3) % l for l in small_primes):
+                candidates.append(c)
+        t = median_time(lambda: [subroutines.is_strong_strong_prime_generator(c) for c in candidates], args.runs)
+        measurements.append(measurement(name, len(candidates) / t, "cand/s", True))
+    return measurements
+
+
+def bench_proof(args, seed):
+    measurements = []
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "05_prove_primes.py")
+    for size in sizes(args.sizes):
+        name = "%s/%d"%("prove_primes" if args.method == "auto" else "prove_primes_%s"%(args.method), size)
+        p = random_prime(size, random_inputs(seed, name))
+        command = [sys.executable, script, str(p), "--method", args.method]
+        t = median_time(lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL), args.runs)
+        measurements.append(measurement(name, t, "s", False))
+    return measurements
+
+
+def _timed_sea_edwards(job):
+    (d, p, nbthreads) = job
+    subroutines.set_pari_threads(nbthreads)
+    t = time.perf_counter()
+    cardinality = subroutines.sea_edwards(1, d, p)
+    return (time.perf_counter() - t, cardinality)
+
+
+def bench_pari_threads(args, seed):
+
+    rng = random_inputs(seed, "pari_threads/%d"%(args.bits))
+    p = random_field_prime(args.bits, rng)
+    ds = random_non_squares(p, args.candidates, rng)
+
+    # A fresh process is used for each measure, since PARI reads the number of threads when its MT engine starts
+    ctx = multiprocessing.get_context("spawn")
+
+    utils.colprint("Cores available:", str(os.cpu_count()))
+
+    in_process = subroutines.pari_threads_supported()
+    if not in_process:
+        print("[WARNING] libpari was built without an MT engine, PariThreadPool is not measured.", file=sys.stderr)
+
+    measurements = []
+    for n in sizes(args.threads):
+
+        # Intra-candidate parallelism: one process, n PARI threads, candidates handled one after the other
+        with ctx.Pool(1) as pool:
+            t = time.perf_counter()
+            results = pool.map(_timed_sea_edwards, [(d, p, n) for d in ds])
+            intra = time.perf_counter() - t
+        latencies = [latency for latency, cardinality in results]
+
+        # Inter-candidate parallelism: n processes, one PARI thread each, one candidate per process
+        with ctx.Pool(n) as pool:
+            t = time.perf_counter()
+            pool.map(_timed_sea_edwards, [(d, p, 1) for d in ds])
+            inter = time.perf_counter() - t
+
+        measurements.append(measurement("pari_threads/%d/%d/latency"%(args.bits, n),
+                                        sum(latencies) / len(latencies), "s", False))
+        measurements.append(measurement("pari_threads/%d/%d/intra_candidate"%(args.bits, n),
+                                        len(ds) / intra, "cand/s", True))
+        measurements.append(measurement("pari_threads/%d/%d/inter_candidate"%(args.bits, n),
+                                        len(ds) / inter, "cand/s", True))
+
+        # Inter-candidate parallelism in this process: n threads, each with its own PARI stack
+        if in_process:
+            pool = subroutines.PariThreadPool(n)
+            t = time.perf_counter()
+            cardinalities = list(pool.map(lambda d: subroutines.sea_edwards(1, d, p), ds))
+            in_process_time = time.perf_counter() - t
+            pool.shutdown()
+            if cardinalities != [cardinality for latency, cardinality in results]:
+                utils.exit_error("The PARI threads and the processes disagree over a %d-bit field."%(args.bits))
+            measurements.append(measurement("pari_threads/%d/%d/in_process"%(args.bits, n),
+                                            len(ds) / in_process_time, "cand/s", True))
+
+    return measurements
+
+
+def bench_legendre(args, seed):
+
+    rng = random_inputs(seed, "legendre/%d"%(args.bits))
+    p = random_field_prime(args.bits, rng)
+    ds = [rng.getrandbits(args.bits) for i in range(args.candidates)]
+    ds[0] = 0 # make sure that the test 1 fails at least once
+    ds[1] = p
+
+    def scalar():
+        return [i for i, d in enumerate(ds) if d != 0 and d < p and gmpy2.legendre(d, p) == -1]
+
+    def bulk():
+        result = []
+        for i in range(0, len(ds), args.block_size):
+            result += [i + j for j in subroutines.non_square_candidates(ds[i:i + args.block_size], p)]
+        return result
+
+    scalar_time = median_time(scalar, args.runs)
+    bulk_time = median_time(bulk, args.runs)
+
+    if bulk() != scalar():
+        utils.exit_error("The block filter and the scalar tests disagree.")
+
+    return [measurement("legendre/%d/scalar"%(args.bits), len(ds) / scalar_time, "cand/s", True),
+            measurement("legendre/%d/block_%d"%(args.bits, args.block_size), len(ds) / bulk_time, "cand/s", True)]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import hashlib
+import json
+import os
+import gmpy2
+
+# A certificate is a JSON object, all integers being hexadecimal strings ("0x..." or "-0x..."):
+#   {"version": 1,
+#    "primes": [N, ...],                                   the primes whose primality is certified
+#    "nodes": [node, ...]}                                 one node per prime > 2 of the proof tree
+# A node is either a Pocklington node:
+#   {"N": N,
+#    "factors": [[p1, m1], [p2, m2], ...],                 A = p1^m1 * p2^m2 * ... divides N-1, and A^2 > N
+#    "witnesses": [a1, a2, ...]}                           ai^(N-1) = 1 mod N and gcd(ai^((N-1)/pi) - 1, N) = 1
+# By the generalized Pocklington theorem, N is prime if all the pi are. Or an ECPP node (one step of an Atkin-Morain
+# certificate, as returned by PARI's primecert):
+#   {"N": N,
+#    "a": a, "b": b,                                       E: y^2 = x^3 + a*x + b over Z/NZ, gcd(4a^3 + 27b^2, N) = 1
+#    "t": t, "s": s,                                       t^2 <= 4N, m = N + 1 - t = s * q, (N^(1/4) + 1)^2 < q < N
+#    "x": x, "y": y}                                       P = (x, y) on E, [s]P != O mod every prime of N, [m]P = O
+# By the Goldwasser-Kilian theorem, N is prime if q is. Every pi or q must be 2 or have its own node, and is checked to
+# be < N, so the nodes can be checked independently of each other.
+
+VERSION = 1
+
+ECPP_KEYS = ["a", "b", "t", "s", "x", "y"]
+
+
+def save(filename, primes, proofs):
+    """Write the certificate of the primes, proofs[N] being the node of N: a dictionary {"factors": [[p,m],...],
+    "witnesses": [a,...]} or {"a": a, "b": b, "t": t, "s": s, "x": x, "y": y}.
+    """
+    nodes = [_node_to_json(N, proofs[N]) for N in sorted(proofs)]
+    with open(filename, "w") as f:
+        json.dump({"version": VERSION, "primes": [_hex(N) for N in sorted(primes)], "nodes": nodes}, f, indent=1)
+
+
+def load(filename):
+    """Return (primes, proofs) as given to save."""
+    with open(filename, "r") as f:
+        data = json.load(f)
+    if data.get("version") != VERSION:
+        raise ValueError("%s is not a certificate of version %d."%(filename, VERSION))
+    proofs = {}
+    for node in data["nodes"]:
+        proofs[int(node["N"], 16)] = _node_from_json(node)
+    return ([int(N, 16) for N in data["primes"]], proofs)
+
+
+def is_ecpp(node):
+    return "factors" not in node
+
+
+def children(N, node):
+    """Return the numbers whose primality the node of N relies on."""
+    if is_ecpp(node):
+        return [(N + 1 - node["t"]) // node["s"]]
+    return [p for p, m in node["factors"]]
+
+
+def missing_nodes(primes, proofs):
+    """Return the sorted list of the numbers > 2 that the certificate relies on but does not prove."""
+    needed = set(primes)
+    for N, node in proofs.items():
+        needed.update(children(N, node))
+    return sorted(N for N in needed if N != 2 and N not in proofs)
+
+
+def check_node(N, node):
+    """Check the conditions of one node, with modular exponentiations and elliptic curve operations only."""
+    if N < 3 or N % 2 == 0:
+        return False
+    if is_ecpp(node):
+        return _check_ecpp(N, node)
+    return _check_pocklington(N, node["factors"], node["witnesses"])
+
+
+def _check_pocklington(N, factors, witnesses):
+    if len(factors) != len(witnesses) or not factors:
+        return False
+    A = 1
+    for p, m in factors:
+        if p < 2 or m < 1:
+            return False
+        A *= p**m
+    if (N - 1) % A != 0 or A * A <= N:
+        return False
+    for (p, m), a in zip(factors, witnesses):
+        if gmpy2.powmod(a, N - 1, N) != 1 or gmpy2.gcd(gmpy2.powmod(a, (N - 1) // p, N) - 1, N) != 1:
+            return False
+    return True
+
+
+def _check_ecpp(N, node):
+    (t, s) = (node["t"], node["s"])
+    (a, b, x, y) = (node["a"] % N, node["b"] % N, node["x"] % N, node["y"] % N)
+    m = N + 1 - t
+    # Hasse bound t^2 <= 4N, and q < N so that the proof tree has no cycle
+    if N % 3 == 0 or s < 1 or t * t > 4 * N or m % s != 0 or gmpy2.gcd(4*a**3 + 27*b**2, N) != 1:
+        return False
+    q = m // s
+    if q >= N:
+        return False
+    # q > (N^(1/4) + 1)^2, with N^(1/4) rounded up
+    (r, exact) = gmpy2.iroot(N, 4)
+    if q <= (r + (0 if exact else 1) + 1)**2:
+        return False
+    if (y*y - x**3 - a*x - b) % N != 0:
+        return False
+    # Every inversion must succeed (an impossible one reveals a factor of N), so the affine points computed modulo N are
+    # reduced modulo every prime of N: [s]P is then an affine point modulo each of them, and [q]([s]P) must be O
+    try:
+        Q = _ec_mul(s, (x, y), a, N)
+        return Q is not None and _ec_mul(q, Q, a, N) is None
+    except ZeroDivisionError:
+        return False
+
+
+def _ec_add(P, Q, a, N):
+    # Affine addition on y^2 = x^3 + a*x + b over Z/NZ, O being None. Raise ZeroDivisionError if N is found composite.
+    if P is None:
+        return Q
+    if Q is None:
+        return P
+    (x1, y1) = P
+    (x2, y2) = Q
+    if x1 == x2:
+        if (y1 + y2) % N == 0:
+            return None
+        if y1 != y2:
+            raise ZeroDivisionError
+        l = (3*x1*x1 + a) * _invert(2*y1, N) % N
+    else:
+        l = (y2 - y1) * _invert(x2 - x1, N) % N
+    x3 = (l*l - x1 - x2) % N
+    return (x3, (l*(x1 - x3) - y1) % N)
+
+
+def _ec_mul(k, P, a, N):
+    R = None
+    for bit in bin(k)[2:]:
+        R = _ec_add(R, R, a, N)
+        if bit == "1":
+            R = _ec_add(R, P, a, N)
+    return R
+
+
+def _invert(u, N):
+    if gmpy2.gcd(u, N) != 1:
+        raise ZeroDivisionError
+    return int(gmpy2.invert(u, N))
+
+
+def _node_to_json(N, node):
+    if is_ecpp(node):
+        return dict([("N", _hex(N))] + [(k, _hex(node[k])) for k in ECPP_KEYS])
+    return {"N": _hex(N),
+            "factors": [[_hex(p), m] for p, m in node["factors"]],
+            "witnesses": [_hex(a) for a in node["witnesses"]]}
+
+
+def _node_from_json(node):
+    if "factors" in node:
+        return {"factors": [(int(p, 16), m) for p, m in node["factors"]],
+                "witnesses": [int(a, 16) for a in node["witnesses"]]}
+    return {k: int(node[k], 16) for k in ECPP_KEYS}
+
+
+class Store:
+    """Persistent store of the nodes of proof trees, shared by the runs of 05_prove_primes.py and by concurrent processes.
+    Each node is a JSON file in directory/xx/h.json, h being the SHA-256 of N in hexadecimal and xx its first two digits.
+    Files are written atomically, and a node is only returned after its conditions are checked again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, N):
+        h = hashlib.sha256(_hex(N).encode("ascii")).hexdigest()
+        return os.path.join(self.directory, h[:2], h + ".json")
+
+    def get(self, N):
+        """Return the node of N, as in the proofs given to save, or None if it is not in the store."""
+        try:
+            with open(self._path(N), "r") as f:
+                data = json.load(f)
+            node = _node_from_json(data)
+        except (OSError, ValueError, KeyError):
+            return None
+        if int(data["N"], 16) != N or not check_node(N, node):
+            return None
+        return node
+
+    def put(self, N, node):
+        path = self._path(N)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d.tmp"%(path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(_node_to_json(N, node), f)
+        os.replace(tmp, path)
+
+
+def _hex(n):
+    return "-0x%x"%(-n) if n < 0 else "0x%x"%(n)
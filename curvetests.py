@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import subroutines
+
+# The tests of 04_generate_curve_using_bbs.py on one candidate d, shared with asyncsearch.py
+
+
+def test_candidate(candidate, d, is_non_square, p, fast):
+    """Perform the tests 1 to 8 on the candidate d (is_non_square being the result of the test 2, computed beforehand by
+    the caller). Return None if one of the tests fails, and the properties of the curve otherwise.
+    """
+        
+    # Test 1
+        
+    if not candidate.check(d != 0 and d < p, "d != 0 and d < p", 1):
+        return None
+
+    # Test 2 (already computed by the caller)
+        
+    if not candidate.check(is_non_square, "d is not a square modulo p", 2):
+        return None
+        
+    # Test 3
+        
+    with candidate.stage("sea"):
+        if fast:
+            cardinality = subroutines.sea_edwards(1, d, p, 4)
+        else:
+            cardinality = subroutines.sea_edwards(1, d, p)
+    assert(cardinality % 4 == 0)
+    q = cardinality>>2
+    with candidate.stage("primality"):
+        q_is_prime = subroutines.deterministic_is_pseudo_prime(q)
+    if not candidate.check(q_is_prime, "The curve cardinality / 4 is prime", 3):
+        return None
+
+    # Test 4
+        
+    trace = p+1-cardinality
+    cardinality_twist = p+1+trace
+    assert(cardinality_twist % 4 == 0)
+    q_twist = cardinality_twist>>2
+    with candidate.stage("primality"):
+        q_twist_is_prime = subroutines.deterministic_is_pseudo_prime(q_twist)
+    if not candidate.check(q_twist_is_prime, "The twist cardinality / 4 is prime", 4):
+        return None
+        
+    # Test 5
+
+    if not candidate.check(q != p and q_twist != p, "Curve and twist are safe against additive transfer", 5):
+        return None
+        
+    # Test 6
+
+    with candidate.stage("embedding_degree"):
+        embedding_degree = subroutines.embedding_degree(p, q)
+    if not candidate.check(embedding_degree > (q-1) // 100, "Curve is safe against multiplicative transfer", 6):
+        return None
+
+    # Test 7
+
+    with candidate.stage("embedding_degree"):
+        embedding_degree_twist = subroutines.embedding_degree(p, q_twist)
+    if not candidate.check(embedding_degree_twist > (q_twist-1) // 100, "Twist is safe against multiplicative transfer", 7):
+        return None
+
+    # Test 8
+
+    with candidate.stage("discriminant"):
+        D = subroutines.cm_field_discriminant(p, trace)
+    if not candidate.check(abs(D) >= 2**100, "Absolute value of the discriminant is larger than 2^100", 8):
+        return None
+
+    return (cardinality, cardinality_twist, q, trace, embedding_degree, embedding_degree_twist, D)
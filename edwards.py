@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import subroutines
+import gmpy2
+
+
+class EdwardsCurve:
+    """Twisted Edwards curve a*x^2 + y^2 = 1 + d*x^2*y^2 over Fp, with points in extended coordinates (X:Y:Z:T), where
+    x = X/Z, y = Y/Z and x*y = T/Z (see Hisil, Wong, Carter, Dawson, "Twisted Edwards Curves Revisited", 2008). The
+    addition formulas are complete when a is a square and d is not a square modulo p, which is the case of the curves
+    generated by 04_generate_curve_using_bbs.py (a = 1).
+    """
+
+    def __init__(self, d, p, a=1):
+        self.p = gmpy2.mpz(p)
+        self.a = gmpy2.mpz(a) % self.p
+        self.d = gmpy2.mpz(d) % self.p
+        self.identity = (gmpy2.mpz(0), gmpy2.mpz(1), gmpy2.mpz(1), gmpy2.mpz(0))
+
+    def point(self, x, y):
+        """Return the point of affine coordinates (x, y) in extended coordinates."""
+        x = gmpy2.mpz(x) % self.p
+        y = gmpy2.mpz(y) % self.p
+        return (x, y, gmpy2.mpz(1), (x * y) % self.p)
+
+    def is_on_curve(self, P):
+        (X, Y, Z, T) = P
+        p = self.p
+        if Z % p == 0 or (X * Y - Z * T) % p != 0:
+            return False
+        X2 = X * X
+        Y2 = Y * Y
+        Z2 = Z * Z
+        return ((self.a * X2 + Y2) * Z2 - Z2 * Z2 - self.d * X2 * Y2) % p == 0
+
+    def is_identity(self, P):
+        (X, Y, Z, T) = P
+        return X % self.p == 0 and (Y - Z) % self.p == 0
+
+    def equal(self, P, Q):
+        (X1, Y1, Z1, T1) = P
+        (X2, Y2, Z2, T2) = Q
+        return (X1 * Z2 - X2 * Z1) % self.p == 0 and (Y1 * Z2 - Y2 * Z1) % self.p == 0
+
+    def neg(self, P):
+        (X, Y, Z, T) = P
+        return (-X % self.p, Y, Z, -T % self.p)
+
+    def add(self, P, Q):
+        """Return P + Q without any modular inversion ("add-2008-hwcd")."""
+        (X1, Y1, Z1, T1) = P
+        (X2, Y2, Z2, T2) = Q
+        p = self.p
+        A = X1 * X2 % p
+        B = Y1 * Y2 % p
+        C = self.d * T1 * T2 % p
+        D = Z1 * Z2 % p
+        E = ((X1 + Y1) * (X2 + Y2) - A - B) % p
+        F = D - C
+        G = D + C
+        H = B - self.a * A
+        return (E * F % p, G * H % p, F * G % p, E * H % p)
+
+    def double(self, P):
+        """Return 2P without any modular inversion ("dbl-2008-hwcd")."""
+        (X1, Y1, Z1, T1) = P
+        p = self.p
+        A = X1 * X1 % p
+        B = Y1 * Y1 % p
+        C = 2 * Z1 * Z1 % p
+        D = self.a * A
+        E = ((X1 + Y1) * (X1 + Y1) - A - B) % p
+        G = D + B
+        F = G - C
+        H = D - B
+        return (E * F % p, G * H % p, F * G % p, E * H % p)
+
+    def mul(self, k, P, w=4):
+        """Return kP, using a width-w NAF of k."""
+        if k < 0:
+            return self.mul(-k, self.neg(P), w)
+
+        # Precompute P, 3P, 5P, ..., (2^(w-1) - 1)P
+        table = [P]
+        if w > 2:
+            P2 = self.double(P)
+            for i in range(1, 1 << (w - 2)):
+                table.append(self.add(table[-1], P2))
+
+        R = self.identity
+        for digit in reversed(naf(k, w)):
+            R = self.double(R)
+            if digit > 0:
+                R = self.add(R, table[digit >> 1])
+            elif digit < 0:
+                R = self.add(R, self.neg(table[(-digit) >> 1]))
+        return R
+
+    def normalize(self, points):
+        """Return the affine coordinates (x, y) of all the points, using a single modular inversion."""
+        inverses = subroutines.batch_invert([Z for (X, Y, Z, T) in points], self.p)
+        return [(int(X * iZ % self.p), int(Y * iZ % self.p)) for ((X, Y, Z, T), iZ) in zip(points, inverses)]
+
+    def has_order(self, P, q):
+        """Return True if P is a point of the curve of prime order q, i.e., P is not the identity and qP is."""
+        return self.is_on_curve(P) and not self.is_identity(P) and self.is_identity(self.mul(q, P))
+
+
+def naf(k, w=2):
+    """Return the width-w non-adjacent form of k >= 0, least significant digit first. All digits are zero or odd and of
+    absolute value less than 2^(w-1), and any w consecutive digits contain at most one non-zero digit.
+    """
+    digits = []
+    while k > 0:
+        if k & 1:
+            digit = k & ((1 << w) - 1)
+            if digit >= 1 << (w - 1):
+                digit -= 1 << w
+            k -= digit
+        else:
+            digit = 0
+        digits.append(digit)
+        k >>= 1
+    return digits
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import argparse
+import json
+import os
+import struct
+import utils
+import gmpy2
+
+# The parameter files exchanged by the scripts map names to integers, and come in three formats:
+#   json   -- a JSON object with decimal numbers, as in MDCurve201601;
+#   hex    -- a JSON object with hexadecimal strings ("0x..." or "-0x..."), which are converted in linear time;
+#   binary -- a header, then for each parameter its name, its sign and its absolute value, stored big endian.
+# The format of a file is detected when it is read, so that all the scripts accept all the formats.
+
+FORMATS = ["json", "hex", "binary"]
+
+MAGIC = b"MDCPARAM"
+VERSION = 1
+HEADER = struct.Struct(">8sHH")  # magic, version, number of parameters
+ENTRY = struct.Struct(">BBI")    # length of the name, sign (1 if negative), length of the absolute value in bytes
+MPZ = type(gmpy2.mpz(0))         # the integers of gmpy2 are not instances of int
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Convert a parameter file written by the scripts to another format.")
+    parser.add_argument("input_file", help="Parameter file, in any format.")
+    parser.add_argument("output_file", help="Output file. It should not exist already.")
+    parser.add_argument("--format", choices=FORMATS, default="json", help="Format of the output file (default is json).")
+
+    args = parser.parse_args()
+
+    if os.path.exists(args.output_file):
+        utils.exit_error("The output file '%s' already exists. Exiting."%(args.output_file))
+
+    save(args.output_file, load(args.input_file), args.format)
+
+
+def load(filename):
+    """Return the dictionary of the integers stored in filename, whatever its format."""
+    with open(filename, "rb") as f:
+        content = f.read()
+    if content.startswith(MAGIC):
+        return _from_binary(content, filename)
+    # Decimal numbers are parsed by gmpy2, which is not subject to the limit on the number of digits of Python >= 3.11
+    data = json.loads(content.decode("UTF-8"), parse_int=lambda s: int(gmpy2.mpz(s)))
+    return {k: _from_hex(v) if isinstance(v, str) else v for k, v in data.items()}
+
+
+def save(filename, data, format="json"):
+    """Write the dictionary of integers "data" to filename in the given format."""
+    if format == "binary":
+        with open(filename, "wb") as f:
+            f.write(_to_binary(data))
+        return
+    if format == "hex":
+        with open(filename, "w") as f:
+            json.dump({k: _to_hex(v) for k, v in data.items()}, f, sort_keys=True)
+        return
+    with open(filename, "w") as f:
+        f.write(_to_json(data))
+
+
+def _to_json(data):
+    # As json.dump(data, f, sort_keys=True), with the integers written by gmpy2, since Python >= 3.11 refuses to convert
+    # integers of more than 4300 digits to decimal
+    items = []
+    for k in sorted(data):
+        v = data[k]
+        v = gmpy2.mpz(v).digits() if isinstance(v, (int, MPZ)) and not isinstance(v, bool) else json.dumps(v)
+        items.append("%s: %s"%(json.dumps(k), v))
+    return "{%s}"%(", ".join(items))
+
+
+def _to_hex(n):
+    return "-0x%x"%(-n) if n < 0 else "0x%x"%(n)
+
+
+def _from_hex(s):
+    if s.startswith("-"):
+        return -int(s[1:], 16)
+    return int(s, 16)
+
+
+def _to_binary(data):
+    chunks = [HEADER.pack(MAGIC, VERSION, len(data))]
+    for name in sorted(data):
+        n = int(data[name])
+        value = abs(n).to_bytes((abs(n).bit_length() + 7) // 8, "big")
+        name = name.encode("UTF-8")
+        chunks += [ENTRY.pack(len(name), 1 if n < 0 else 0, len(value)), name, value]
+    return b"".join(chunks)
+
+
+def _from_binary(content, filename):
+    (magic, version, count) = HEADER.unpack_from(content)
+    if version != VERSION:
+        raise ValueError("%s is a parameter file of version %d, not %d."%(filename, version, VERSION))
+    data = {}
+    offset = HEADER.size
+    for i in range(count):
+        (name_length, negative, value_length) = ENTRY.unpack_from(content, offset)
+        offset += ENTRY.size
+        name = content[offset:offset + name_length].decode("UTF-8")
+        offset += name_length
+        n = int.from_bytes(content[offset:offset + value_length], "big")
+        offset += value_length
+        data[name] = -n if negative else n
+    if offset != len(content):
+        raise ValueError("%s has trailing data."%(filename))
+    return data
+
+
+if __name__ == "__main__":
+    main()
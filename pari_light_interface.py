@@ -21,82 +21,310 @@
 import os
 import ctypes
 import ctypes.util
+import json
+import math
+import threading
+import time
 
-libpari = ctypes.CDLL(ctypes.util.find_library("pari"))
+# libpari is only located and loaded when a script first calls PARI, so that importing this module costs nothing to the
+# scripts that never do
 
+_libpari = None
 
-_fx_pari_version          = libpari.pari_version
-_fx_pari_version.argtypes = None
-_fx_pari_version.restype  = ctypes.c_void_p
+
+class PariUnsupported(RuntimeError):
+    """Raised when the loaded libpari lacks a capability, e.g. because it is too old or built without an MT engine."""
+
+
+def libpari():
+    """Return libpari, loading it on the first call."""
+    global _libpari
+    if _libpari is None:
+        name = ctypes.util.find_library("pari")
+        if name is None:
+            raise OSError("Cannot find libpari")
+        _libpari = ctypes.CDLL(name)
+    return _libpari
+
+
+class _dl_info(ctypes.Structure):
+    _fields_ = [("dli_fname", ctypes.c_char_p), # Deduced from dlfcn.h
+                ("dli_fbase", ctypes.c_void_p),
+                ("dli_sname", ctypes.c_char_p),
+                ("dli_saddr", ctypes.c_void_p)]
+
+
+def library_path():
+    """Return the path of the file libpari was loaded from (its name on systems without dladdr)."""
+    try:
+        dladdr = ctypes.CDLL(None).dladdr
+    except (AttributeError, OSError):
+        return libpari()._name
+    dladdr.argtypes = [ctypes.c_void_p, ctypes.POINTER(_dl_info)]
+    info = _dl_info()
+    if not dladdr(ctypes.cast(libpari().pari_version, ctypes.c_void_p), ctypes.byref(info)) or not info.dli_fname:
+        return libpari()._name
+    return os.path.realpath(info.dli_fname.decode("UTF-8"))
+
+
+class _function:
+    """Function of libpari with the given prototype, looked up on its first call. An optional function (one that old
+    versions of PARI do not export) is false if libpari lacks it.
+    """
+
+    def __init__(self, name, argtypes, restype, optional=False):
+        self.name = name
+        self.argtypes = argtypes
+        self.restype = restype
+        self.optional = optional
+        self.fx = None
+        self.resolved = False
+
+    def resolve(self):
+        if not self.resolved:
+            self.fx = getattr(libpari(), self.name, None) if self.optional else getattr(libpari(), self.name)
+            if self.fx is not None:
+                self.fx.argtypes = self.argtypes
+                self.fx.restype = self.restype
+            self.resolved = True
+        return self.fx
+
+    def __bool__(self):
+        return self.resolve() is not None
+
+    def __call__(self, *args):
+        return self.resolve()(*args)
+
+
+_fx_pari_version = _function("pari_version", None, ctypes.c_void_p)
 
 def pari_version():
     return _fx_pari_version()
 
 
-_fx_pari_sd_datadir          = libpari.sd_datadir
-_fx_pari_sd_datadir.argtypes = [ctypes.c_char_p, ctypes.c_long]
-_fx_pari_sd_datadir.restype  = ctypes.c_void_p
+_fx_pari_sd_datadir = _function("sd_datadir", [ctypes.c_char_p, ctypes.c_long], ctypes.c_void_p)
 
 def pari_sd_datadir():
     return _fx_pari_sd_datadir(None, 3) # Deduced from paridecl.h
 
 
-_fx_pari_init          = libpari.pari_init
-_fx_pari_init.argtypes = [ctypes.c_size_t, ctypes.c_ulong]
-_fx_pari_init.restype  = None
+_fx_pari_init = _function("pari_init", [ctypes.c_size_t, ctypes.c_ulong], None)
 
 def pari_init(size, maxprime):
     _fx_pari_init(size, maxprime)
 
 
-_fx_pari_close          = libpari.pari_close
-_fx_pari_close.argtypes = None
-_fx_pari_close.restype  = None
+_fx_pari_close = _function("pari_close", None, None)
 
 def pari_close():
     _fx_pari_close()
-    
 
-_fx_pari_gp_read_str          = libpari.gp_read_str
-_fx_pari_gp_read_str.argtypes = [ctypes.c_char_p]
-_fx_pari_gp_read_str.restype  = ctypes.c_void_p
+
+_fx_pari_paristack_setsize = _function("paristack_setsize", [ctypes.c_size_t, ctypes.c_size_t], None,
+                                       optional=True) # Only available in PARI >= 2.9
+
+def pari_paristack_setsize(rsize, vsize):
+    """Set the size of the PARI stack to rsize, and let PARI grow it automatically up to vsize when it overflows."""
+    if not _fx_pari_paristack_setsize:
+        raise PariUnsupported("This version of PARI cannot resize its stack")
+    _fx_pari_paristack_setsize(rsize, vsize)
+
+
+def pari_has_resizable_stack():
+    return bool(_fx_pari_paristack_setsize)
+
+
+_fx_pari_getstack = _function("getstack", None, ctypes.c_long)
+
+def pari_getstack():
+    """Return the number of bytes currently used on the PARI stack."""
+    return _fx_pari_getstack()
+
+
+# avma and pari_mainstack are thread local in PARI builds with an MT engine, so they must be looked up from the thread
+# using them every time.
+
+def pari_get_avma():
+    return ctypes.c_size_t.in_dll(libpari(), "avma").value
+
+
+def pari_set_avma(av):
+    ctypes.c_size_t.in_dll(libpari(), "avma").value = av
+
+
+class _pari_mainstack(ctypes.Structure):
+    _fields_ = [("top",     ctypes.c_size_t), # Deduced from paristio.h
+                ("bot",     ctypes.c_size_t),
+                ("vbot",    ctypes.c_size_t),
+                ("size",    ctypes.c_size_t),
+                ("rsize",   ctypes.c_size_t),
+                ("vsize",   ctypes.c_size_t),
+                ("memused", ctypes.c_size_t)]
+
+def pari_stack_size():
+    """Return the current size of the PARI stack (which grows up to its maximal size), or None if this version of PARI
+    does not expose it."""
+    try:
+        mainstack = ctypes.POINTER(_pari_mainstack).in_dll(libpari(), "pari_mainstack")
+    except ValueError:
+        return None # PARI < 2.9
+    return mainstack.contents.size
+
+
+_fx_pari_mt_init = _function("pari_mt_init", None, None, optional=True) # Only available in PARI >= 2.8
+
+def pari_mt_init():
+    if _fx_pari_mt_init:
+        _fx_pari_mt_init()
+
+
+_fx_pari_mt_close = _function("pari_mt_close", None, None, optional=True) # Only available in PARI >= 2.8
+
+def pari_mt_close():
+    if _fx_pari_mt_close:
+        _fx_pari_mt_close()
+
+
+def pari_mt_engine():
+    try:
+        return ctypes.c_char_p.in_dll(libpari(), "paricfg_mt_engine").value.decode("UTF-8")
+    except ValueError:
+        return "single" # PARI < 2.8 has no MT engine
+
+
+_fx_pari_sd_nbthreads = _function("sd_nbthreads", [ctypes.c_char_p, ctypes.c_long], ctypes.c_void_p,
+                                  optional=True) # Only available in PARI >= 2.8
+
+def pari_sd_nbthreads(n):
+    if not _fx_pari_sd_nbthreads:
+        raise PariUnsupported("This version of PARI does not support multithreading")
+    return _fx_pari_sd_nbthreads(str(n).encode("UTF-8"), 0) # 0 is d_SILENT, deduced from paridecl.h
+
+
+def pari_nbthreads():
+    try:
+        return ctypes.c_long.in_dll(libpari(), "pari_mt_nbthreads").value
+    except ValueError:
+        return 1
+
+
+# PARI threads: each thread using PARI needs its own stack, allocated by pari_thread_valloc and installed in the thread
+# by pari_thread_start. This requires thread local variables in libpari, which only the builds with an MT engine have.
+
+class _pari_thread(ctypes.Structure):
+    _fields_ = [("st",   _pari_mainstack),      # Deduced from paristio.h (PARI >= 2.9)
+                ("rest", ctypes.c_char * 1024)] # struct pari_global_state gs and GEN data, whose layout depends on the
+                                                # version (they take 80 bytes in PARI 2.17), with room to spare
+
+_fx_pari_thread_valloc = _function("pari_thread_valloc",
+                                   [ctypes.POINTER(_pari_thread), ctypes.c_size_t, ctypes.c_size_t, ctypes.c_void_p],
+                                   None, optional=True) # Only available in PARI >= 2.9
+_fx_pari_thread_start = _function("pari_thread_start", [ctypes.POINTER(_pari_thread)], ctypes.c_void_p, optional=True)
+_fx_pari_thread_close = _function("pari_thread_close", None, None, optional=True)
+_fx_pari_thread_free = _function("pari_thread_free", [ctypes.POINTER(_pari_thread)], None, optional=True)
+
+def pari_has_threads():
+    return bool(_fx_pari_thread_valloc) and pari_mt_engine() != "single"
+
+def pari_thread_alloc(size, size_max):
+    """Return a new PARI thread, whose stack has the initial size "size" and may grow up to size_max."""
+    if not pari_has_threads():
+        raise PariUnsupported("This version of PARI does not support threads")
+    t = _pari_thread()
+    _fx_pari_thread_valloc(ctypes.byref(t), size, size_max, None)
+    return t
+
+def pari_thread_start(t):
+    """Make the calling thread use the stack of t. To be called by the new thread before any other call to PARI."""
+    _fx_pari_thread_start(ctypes.byref(t))
+
+def pari_thread_close():
+    """Free the thread local data of PARI. To be called by the thread when it stops using PARI."""
+    _fx_pari_thread_close()
+
+def pari_thread_free(t):
+    """Free the stack of t, once its thread has called pari_thread_close()."""
+    _fx_pari_thread_free(ctypes.byref(t))
+
+
+# The modular polynomials of the seadata package, loaded once per thread, can be handed over to other threads
+
+_fx_pari_get_seadata = _function("pari_get_seadata", None, ctypes.c_void_p, optional=True)
+_fx_pari_set_seadata = _function("pari_set_seadata", [ctypes.c_void_p], None, optional=True)
+
+def pari_get_seadata():
+    """Return the modular polynomials loaded by the calling thread (None if none or if PARI cannot share them)."""
+    return _fx_pari_get_seadata() if _fx_pari_get_seadata else None
+
+def pari_set_seadata(seadata):
+    if _fx_pari_set_seadata:
+        _fx_pari_set_seadata(seadata)
+
+
+_fx_pari_gp_read_str = _function("gp_read_str", [ctypes.c_char_p], ctypes.c_void_p)
 
 def pari_gp_read_str(s):
+    if _stats is not None:
+        return _recorded_call("gp_read_str", lambda: [str(s)], _fx_pari_gp_read_str, str(s).encode("UTF-8"))
     return _fx_pari_gp_read_str(str(s).encode("UTF-8"))
 
 
-_fx_pari_GENtostr          = libpari.GENtostr
-_fx_pari_GENtostr.argtypes = [ctypes.c_void_p]
-_fx_pari_GENtostr.restype  = ctypes.c_char_p
+_fx_pari_GENtostr = _function("GENtostr", [ctypes.c_void_p], ctypes.c_char_p)
 
 def pari_GENtostr(a):
     return _fx_pari_GENtostr(a)
 
 
-_fx_pari_addii          = libpari.addii
-_fx_pari_addii.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
-_fx_pari_addii.restype  = ctypes.c_void_p
+_fx_pari_addii = _function("addii", [ctypes.c_void_p, ctypes.c_void_p], ctypes.c_void_p)
 
 def pari_addii(a, b):
     return _fx_pari_addii(a, b)
 
 
-_fx_pari_Fp_ellcard_SEA          = libpari.Fp_ellcard_SEA
-_fx_pari_Fp_ellcard_SEA.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_long]
-_fx_pari_Fp_ellcard_SEA.restype  = ctypes.c_void_p
+_fx_pari_Fp_ellcard_SEA = _function("Fp_ellcard_SEA",
+                                    [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_long],
+                                    ctypes.c_void_p)
 
 def pari_Fp_ellcard_SEA(a4, a6, p, s):
+    if _stats is not None:
+        return _recorded_call("Fp_ellcard_SEA", lambda: _GENstostr(a4, a6, p), _fx_pari_Fp_ellcard_SEA, a4, a6, p, s)
     return _fx_pari_Fp_ellcard_SEA(a4, a6, p, s)
 
 
-_fx_pari_Z_factor          = libpari.Z_factor
-_fx_pari_Z_factor.argtypes = [ctypes.c_void_p]
-_fx_pari_Z_factor.restype  = ctypes.c_void_p
+_fx_pari_Z_factor = _function("Z_factor", [ctypes.c_void_p], ctypes.c_void_p)
 
 def pari_Z_factor(n):
+    if _stats is not None:
+        return _recorded_call("Z_factor", lambda: _GENstostr(n), _fx_pari_Z_factor, n)
     return _fx_pari_Z_factor(n)
 
 
+_fx_pari_Z_ECM = _function("Z_ECM", [ctypes.c_void_p, ctypes.c_long, ctypes.c_long, ctypes.c_ulong], ctypes.c_void_p,
+                           optional=True) # Not exported by old versions of PARI
+
+def pari_has_ecm():
+    return bool(_fx_pari_Z_ECM)
+
+def pari_Z_ECM(n, rounds, seed, B1):
+    """Return a non trivial factor of n found by ECM with the given bound B1, or None."""
+    if _stats is not None:
+        return _recorded_call("Z_ECM", lambda: _GENstostr(n) + [B1], _fx_pari_Z_ECM, n, rounds, seed, B1)
+    return _fx_pari_Z_ECM(n, rounds, seed, B1)
+
+
+_fx_pari_primecert = _function("primecert", [ctypes.c_void_p, ctypes.c_long], ctypes.c_void_p,
+                               optional=True) # Only available in PARI >= 2.11
+
+def pari_has_primecert():
+    return bool(_fx_pari_primecert)
+
+def pari_primecert(n, flag):
+    """Return a primality certificate of n (with flag = 0, the Atkin-Morain ECPP certificate, or n if n < 2^64)."""
+    if _stats is not None:
+        return _recorded_call("primecert", lambda: _GENstostr(n), _fx_pari_primecert, n, flag)
+    return _fx_pari_primecert(n, flag)
+
+
 def pari_gel(x, i):
     s = ctypes.sizeof(ctypes.c_void_p)
     v = ctypes.c_void_p.from_address(x + i*s)
@@ -108,3 +336,100 @@ def pari_lg(z):
     header = ctypes.c_long.from_address(z).value
     mask = (1 << (8*s - 8)) - 1 # Deduced from parigen.h
     return header & mask
+
+
+# Optional instrumentation of the expensive calls: for each wrapped function, record the wall time, the CPU time (of
+# all the threads of the process), the number of bytes taken on the PARI stack (avma consumption) and the size of the
+# PARI stack after the call, which only grows and thus gives its peak.
+
+PARI_STATS_SLOWEST = 10 # Number of slowest calls whose arguments are kept, to spot pathological inputs
+
+_stats = None
+_stats_lock = threading.Lock()
+
+def pari_stats_enable():
+    global _stats
+    if _stats is None:
+        _stats = {}
+
+
+def pari_stats_disable():
+    global _stats
+    _stats = None
+
+
+def pari_stats():
+    """Return the statistics recorded since pari_stats_enable(), as a dictionary that can be serialized to JSON."""
+    if _stats is None:
+        return {}
+    with _stats_lock:
+        return {name: {"calls": r["calls"],
+                       "wall_time": _metric_summary(r["wall_time"]),
+                       "cpu_time": _metric_summary(r["cpu_time"]),
+                       "avma_consumption": _metric_summary(r["avma_consumption"]),
+                       "peak_stack_size": r["peak_stack_size"],
+                       "slowest": list(r["slowest"])}
+                for name, r in _stats.items()}
+
+
+def pari_stats_dump(filename):
+    with open(filename, "w") as f:
+        json.dump(pari_stats(), f, indent=2)
+
+
+def _GENstostr(*args):
+    return [pari_GENtostr(a).decode("UTF-8") for a in args]
+
+
+def _new_metric():
+    return {"total": 0, "min": None, "max": None, "histogram": {}}
+
+
+def _metric_summary(m):
+    return {"total": m["total"],
+            "min": m["min"],
+            "max": m["max"],
+            "histogram": {"2^%d"%(k): m["histogram"][k] for k in sorted(m["histogram"])}}
+
+
+def _add_to_metric(m, x):
+    m["total"] += x
+    m["min"] = x if m["min"] is None else min(m["min"], x)
+    m["max"] = x if m["max"] is None else max(m["max"], x)
+    k = math.frexp(x)[1] - 1 if x > 0 else 0 # x lies in [2^k, 2^(k+1)) (or is 0 and counted in 2^0)
+    m["histogram"][k] = m["histogram"].get(k, 0) + 1
+
+
+def _recorded_call(name, arguments, fx, *args):
+    av = pari_get_avma()
+    wall_time = time.perf_counter()
+    cpu_time = time.process_time()
+
+    result = fx(*args)
+
+    cpu_time = time.process_time() - cpu_time
+    wall_time = time.perf_counter() - wall_time
+    avma_consumption = av - pari_get_avma()
+
+    stack_size = pari_stack_size()
+    with _stats_lock: # The threads of subroutines.PariThreadPool record their calls concurrently
+        if name not in _stats:
+            _stats[name] = {"calls": 0,
+                            "wall_time": _new_metric(),
+                            "cpu_time": _new_metric(),
+                            "avma_consumption": _new_metric(),
+                            "peak_stack_size": 0,
+                            "slowest": []}
+        r = _stats[name]
+        r["calls"] += 1
+        _add_to_metric(r["wall_time"], wall_time)
+        _add_to_metric(r["cpu_time"], cpu_time)
+        _add_to_metric(r["avma_consumption"], avma_consumption)
+        if stack_size is not None:
+            r["peak_stack_size"] = max(r["peak_stack_size"], stack_size)
+        if len(r["slowest"]) < PARI_STATS_SLOWEST or wall_time > r["slowest"][-1]["wall_time"]:
+            r["slowest"].append({"wall_time": wall_time, "cpu_time": cpu_time, "arguments": arguments()})
+            r["slowest"].sort(key=lambda x: -x["wall_time"])
+            del r["slowest"][PARI_STATS_SLOWEST:]
+
+    return result
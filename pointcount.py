@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import gmpy2
+
+NAIVE_LIMIT = 1 << 10 # Below this prime, the points are counted one by one
+MAX_POINTS = 64       # Number of points tried by Mestre's algorithm before giving up
+
+
+def ellcard(a, b, p, cofactor=1):
+    """Return the number of points of the elliptic curve y^2 = x^3 + a*x + b over Fp (p an odd prime, the curve being
+    non singular), or None if it could not be determined. The cardinality must be known to be divisible by cofactor,
+    which is either 1, 2 or 4. This is meant for small fields: the running time grows as p^(1/4).
+    """
+    (a, b, p) = (gmpy2.mpz(a) % p, gmpy2.mpz(b) % p, gmpy2.mpz(p))
+    if p < NAIVE_LIMIT:
+        return int(p + 1 + sum(gmpy2.legendre(x**3 + a*x + b, p) for x in range(p)))
+    return _ellcard_mestre(a, b, p, cofactor)
+
+
+def _ellcard_mestre(a, b, p, cofactor):
+    """Mestre's algorithm: intersect the sets of the cardinalities N in the Hasse interval such that N*P = O for points P
+    of the curve, and such that (2p+2-N)*P = O for points P of its quadratic twist, until a single N remains. The
+    cardinality of the twist is 2p+2-N, hence it is also divisible by cofactor.
+    """
+    w = gmpy2.isqrt(4*p)
+    (low, high) = (p + 1 - w, p + 1 + w)
+
+    g = 2 # a non square, to define the twist y^2 = x^3 + a*g^2*x + b*g^3
+    while gmpy2.legendre(g, p) != -1:
+        g += 1
+    curves = [(a, b, False), (a * g**2 % p, b * g**3 % p, True)]
+
+    candidates = None
+    x = [gmpy2.mpz(0), gmpy2.mpz(0)] # next abscissa to try on the curve and on its twist
+    for i in range(MAX_POINTS):
+        (ca, cb, twist) = curves[i & 1]
+        P = _find_point(ca, cb, p, x, i & 1)
+        Q = _mul(cofactor, P, ca, p)
+        if Q is None:
+            continue
+        orders = set(cofactor * k for k in _bsgs(Q, -(-low // cofactor), high // cofactor, ca, p))
+        if twist:
+            orders = set(2*p + 2 - n for n in orders)
+        candidates = orders if candidates is None else candidates & orders
+        if len(candidates) == 1:
+            return int(candidates.pop())
+    return None
+
+
+def _find_point(a, b, p, x, i):
+    """Return a point of y^2 = x^3 + a*x + b with y != 0, trying the abscissas from x[i] on."""
+    while True:
+        u = x[i]
+        x[i] += 1
+        rhs = (u**3 + a*u + b) % p
+        if gmpy2.legendre(rhs, p) == 1:
+            return (u, sqrt_mod(rhs, p))
+
+
+def _bsgs(Q, k_min, k_max, a, p):
+    """Return all the k in [k_min, k_max] such that k*Q = O (baby steps, giant steps)."""
+    m = int(gmpy2.isqrt(max(k_max - k_min, 1) // 2)) + 1
+
+    # Baby steps: j*Q for 1 <= j <= m, indexed by abscissa. A point met twice, or the neutral element, gives the order.
+    baby = {}
+    R = Q
+    for j in range(1, m + 1):
+        if R is None:
+            return _multiples(j, k_min, k_max)
+        if R[0] in baby:
+            return _multiples(j + baby[R[0]], k_min, k_max) # since j*Q = -j'*Q, and no smaller multiple is O
+        baby[R[0]] = j
+        R = _add(R, Q, a, p)
+
+    # Giant steps: c*Q for c = k_min + m, k_min + 3m + 1, ..., each covering the window [c - m, c + m]
+    result = []
+    step = _mul(2*m + 1, Q, a, p)
+    c = k_min + m
+    R = _mul(c, Q, a, p)
+    while c - m <= k_max:
+        if R is None:
+            result.append(c)
+        elif R[0] in baby:
+            j = baby[R[0]]
+            # j*Q and -j*Q have the same abscissa: R = c*Q = j*Q gives (c-j)*Q = O, and R = -j*Q gives (c+j)*Q = O.
+            # When j*Q is of order 2, both hold.
+            if R[1] == 0:
+                result.extend([c - j, c + j])
+            else:
+                result.append(c - j if R[1] == _mul(j, Q, a, p)[1] else c + j)
+        R = _add(R, step, a, p)
+        c += 2*m + 1
+    return [k for k in result if k_min <= k <= k_max]
+
+
+def _multiples(order, k_min, k_max):
+    return range(-(-k_min // order) * order, k_max + 1, order)
+
+
+def _add(P, Q, a, p):
+    """Return P + Q on y^2 = x^3 + a*x + b in affine coordinates, None being the neutral element."""
+    if P is None:
+        return Q
+    if Q is None:
+        return P
+    (x1, y1) = P
+    (x2, y2) = Q
+    if x1 == x2:
+        if (y1 + y2) % p == 0:
+            return None
+        l = (3*x1*x1 + a) * gmpy2.invert(2*y1, p) % p
+    else:
+        l = (y2 - y1) * gmpy2.invert(x2 - x1, p) % p
+    x3 = (l*l - x1 - x2) % p
+    return (x3, (l * (x1 - x3) - y1) % p)
+
+
+def _mul(k, P, a, p):
+    R = None
+    for bit in bin(k)[2:]:
+        R = _add(R, R, a, p)
+        if bit == "1":
+            R = _add(R, P, a, p)
+    return R
+
+
+def sqrt_mod(n, p):
+    """Return a square root of the square n modulo the odd prime p (Tonelli-Shanks)."""
+    n = gmpy2.mpz(n) % p
+    if p % 4 == 3:
+        return gmpy2.powmod(n, (p+1) // 4, p)
+    s = 0
+    t = p - 1
+    while t & 1 == 0:
+        s += 1
+        t >>= 1
+    z = gmpy2.mpz(2)
+    while gmpy2.legendre(z, p) != -1:
+        z += 1
+    c = gmpy2.powmod(z, t, p)
+    r = gmpy2.powmod(n, (t+1) // 2, p)
+    u = gmpy2.powmod(n, t, p)
+    while u != 1:
+        i = 0
+        v = u
+        while v != 1:
+            v = v * v % p
+            i += 1
+        b = gmpy2.powmod(c, 1 << (s - i - 1), p)
+        r = r * b % p
+        c = b * b % p
+        u = u * c % p
+        s = i
+    return r
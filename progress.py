@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import json
+import math
+import os
+import time
+import gmpy2
+
+EULER_GAMMA = 0.5772156649015329
+
+# Correction to 1/ln(N) for the probability that the order N of a random elliptic curve is prime: a small odd prime l
+# divides N with probability about l/(l^2 - 1) instead of 1/l (Galbraith, McKee, "The probability that the number of
+# points on an elliptic curve over a finite field is prime", 2000). Product of (1 - l/(l^2-1)) / (1 - 1/l) over odd l.
+CURVE_ORDER_PRIMALITY_FACTOR = 0.92
+
+
+def curve_tests_probabilities(p):
+    """Return the heuristic probability that a candidate d of 04_generate_curve_using_bbs.py passes each of the tests 1
+    to 8, given that it passed the previous ones. q and q_twist have the same parity, since q + q_twist = (p+1)/2 is even,
+    so once q is an odd prime, q_twist is odd as well.
+    """
+    size = gmpy2.bit_length(p)
+    log_q = math.log(p / 4)
+    return [p / 2**size,                               # Test 1: d < p
+            0.5,                                       # Test 2: d is not a square
+            CURVE_ORDER_PRIMALITY_FACTOR / log_q,      # Test 3: q is prime (and thus odd)
+            2 * CURVE_ORDER_PRIMALITY_FACTOR / log_q,  # Test 4: q_twist is prime, knowing it is odd
+            1, 1, 1, 1]                                # Tests 5 to 8 fail with a negligible probability
+
+
+def field_prime_probabilities(size):
+    """Return the probability that a candidate of 03_generate_prime_field_using_bbs.py, a "size"-bit integer congruent to
+    3 modulo 4, is prime."""
+    return [2 / (size * math.log(2))]
+
+
+def strong_strong_prime_probabilities(min_bitsize, largest_sieving_prime, PI):
+    """Return the heuristic probabilities that a candidate c of 02_generate_bbs_parameters.py, drawn in [0, PI), has at
+    least min_bitsize-2 bits (test 1), and that c, 2c+1 and 4c+3 are all prime (test 2). The three numbers are coprime to
+    all the primes up to largest_sieving_prime, which makes each of them prime with probability about
+    e^gamma * ln(largest_sieving_prime) / ln(c) (Mertens' theorem).
+    """
+    p = math.exp(EULER_GAMMA) * math.log(largest_sieving_prime) / ((min_bitsize - 2) * math.log(2))
+    return [1 - 2**(min_bitsize - 3) / PI, min(1, p**3)]
+
+
+class Progress:
+    """Progress of a search of a candidate which must pass a sequence of tests. It tracks the rate of candidates, the
+    time spent in each stage and the pass rate of each test, and estimates the remaining time by combining the observed
+    pass rates with their theoretical values.
+    """
+
+    def __init__(self, description, probabilities, status_file=None, interval=60):
+        """
+        Keyword arguments:
+        description   -- what is searched (e.g. "curve")
+        probabilities -- theoretical probability that a candidate passes each test, given that it passed the previous
+        status_file   -- JSON file rewritten with the current status at every report (default is no file)
+        interval      -- minimal number of seconds between two reports
+        """
+        self.description = description
+        self.probabilities = probabilities
+        self.status_file = status_file
+        self.interval = interval
+        self.start = time.time()
+        self.last_report = self.start
+        self.candidates = 0
+        self.reached = [0] * len(probabilities) # reached[i] is the number of candidates on which the test i+1 was done
+        self.passed = [0] * len(probabilities)
+        self.durations = {}
+
+    def record(self, rejected_by=None, durations=None):
+        """Record a candidate, rejected by the test number "rejected_by" (None if it passed all the tests)."""
+        self.candidates += 1
+        last = len(self.probabilities) if rejected_by is None else rejected_by
+        for i in range(last):
+            self.reached[i] += 1
+            if i + 1 != rejected_by:
+                self.passed[i] += 1
+        for stage, duration in (durations or {}).items():
+            d = self.durations.setdefault(stage, {"count": 0, "mean": 0, "m2": 0, "min": duration, "max": duration})
+            d["count"] += 1 # Welford's online algorithm for the mean and the variance
+            delta = duration - d["mean"]
+            d["mean"] += delta / d["count"]
+            d["m2"] += delta * (duration - d["mean"])
+            d["min"] = min(d["min"], duration)
+            d["max"] = max(d["max"], duration)
+        if time.time() - self.last_report >= self.interval:
+            self.report()
+
+    def pass_rates(self):
+        """Return the estimated probability of passing each test. The theoretical probability counts as if one candidate
+        was expected to pass it, so that it is quickly superseded by the observations."""
+        rates = []
+        for probability, reached, passed in zip(self.probabilities, self.reached, self.passed):
+            weight = 1 / probability
+            rates.append((passed + 1) / (reached + weight))
+        return rates
+
+    def status(self):
+        elapsed = time.time() - self.start
+        success = 1
+        for rate in self.pass_rates():
+            success *= rate
+        status = {"description": self.description,
+                  "candidates": self.candidates,
+                  "elapsed": elapsed,
+                  "rate": self.candidates / elapsed if elapsed > 0 else None,
+                  "success_probability": success,
+                  "theoretical_success_probability": math.prod(self.probabilities),
+                  "tests": [{"test": i + 1,
+                             "reached": self.reached[i],
+                             "passed": self.passed[i],
+                             "theoretical_pass_rate": self.probabilities[i]}
+                            for i in range(len(self.probabilities))],
+                  "durations": {stage: {"count": d["count"],
+                                        "mean": d["mean"],
+                                        "stddev": math.sqrt(d["m2"] / d["count"]),
+                                        "min": d["min"],
+                                        "max": d["max"]}
+                                for stage, d in self.durations.items()}}
+
+        # The number of remaining candidates follows a geometric distribution, whatever the number of failed candidates
+        if self.candidates and success < 1:
+            time_per_candidate = elapsed / self.candidates
+            remaining = {"expected": 1 / success,
+                         "low": math.log(0.9) / math.log(1 - success),  # 10% chance to be done before
+                         "high": math.log(0.1) / math.log(1 - success)} # 90% chance to be done before
+            status["remaining_candidates"] = remaining
+            status["eta"] = {k: v * time_per_candidate for k, v in remaining.items()}
+        return status
+
+    def report(self):
+        self.last_report = time.time()
+        status = self.status()
+        if "eta" in status:
+            print("[PROGRESS] %d candidates (%.2f/s), success probability 1/%.0f per candidate, expected remaining time %s (10%%: %s, 90%%: %s)"
+                  %(status["candidates"], status["rate"], 1 / status["success_probability"],
+                    format_duration(status["eta"]["expected"]), format_duration(status["eta"]["low"]),
+                    format_duration(status["eta"]["high"])), flush=True)
+        if self.status_file:
+            tmp = self.status_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(status, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.status_file)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 3600:
+        return "%dm%02ds"%(seconds // 60, seconds % 60)
+    return "%dh%02dm"%(seconds // 3600, (seconds // 60) % 60)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import utils
+
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(REPOSITORY, "reproduction")
+
+# Fields of the events of 04_generate_curve_using_bbs.py which do not depend on the machine
+EVENT_FIELDS = ("candidate", "d", "rejected_by")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="""Run the scripts 01 to 05 on the scaled-down reproduction corpus, check
+                                     that their outputs are bit-identical to the recorded ones and that each stage stays
+                                     within its time budget.""")
+    parser.add_argument("--corpus",
+                        help="Directory of the corpus, containing corpus.json (default is %s)."%(CORPUS),
+                        default=CORPUS)
+    parser.add_argument("--budget_factor",
+                        type=float,
+                        help="Multiply all the time budgets by this factor, e.g. on a slow machine (default is 1).",
+                        default=1.0)
+    parser.add_argument("--stage",
+                        action="append",
+                        help="Only run the stages with this name (may be repeated). Their inputs must be recorded outputs.")
+    parser.add_argument("--keep",
+                        help="Directory where the stages are run and their outputs kept (default is a temporary directory).")
+    parser.add_argument("--update",
+                        help="""Overwrite the recorded outputs with the new ones, after an intended change of the outputs.
+                        Time budgets are still checked.
+                        """,
+                        default=False,
+                        action="store_true")
+
+    args = parser.parse_args()
+
+    with open(os.path.join(args.corpus, "corpus.json"), "r") as f:
+        stages = json.load(f)["stages"]
+    if args.stage:
+        unknown = set(args.stage) - set(stage["name"] for stage in stages)
+        if unknown:
+            utils.exit_error("Unknown stage(s): %s."%(", ".join(sorted(unknown))))
+        stages = [stage for stage in stages if stage["name"] in args.stage]
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        workdir = args.keep
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        workdir = tmp.name
+
+    # Stages run alone read their inputs from the recorded outputs
+    if args.stage:
+        for name in os.listdir(os.path.join(args.corpus, "expected")):
+            shutil.copy(os.path.join(args.corpus, "expected", name), workdir)
+
+    failures = 0
+    total = time.perf_counter()
+    for stage in stages:
+        errors = run_stage(stage, args.corpus, workdir, args.budget_factor, args.update)
+        failures += len(errors)
+        for error in errors:
+            print("\t%s"%(error))
+
+    utils.colprint("Total time:", "%.2fs"%(time.perf_counter() - total))
+    if failures:
+        utils.exit_error("%d check(s) failed."%(failures))
+    print("The outputs are identical to the recorded ones and all the stages are within their budget.")
+
+
+def run_stage(stage, corpus, workdir, budget_factor, update):
+    """Run one stage in workdir and return the list of the differences with the recorded outputs."""
+    command = [sys.executable, os.path.join(REPOSITORY, stage["script"])]
+    command += [arg.replace("{corpus}", corpus) for arg in stage["args"]]
+    for output in list(stage.get("outputs", {})) + list(stage.get("events", {})):
+        if os.path.exists(os.path.join(workdir, output)):
+            os.remove(os.path.join(workdir, output))
+
+    t = time.perf_counter()
+    result = subprocess.run(command, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    t = time.perf_counter() - t
+
+    errors = []
+    budget = stage["budget"] * budget_factor
+    utils.colprint("%s:"%(stage["name"]), "%.2fs (budget: %.0fs)"%(t, budget))
+    if result.returncode != stage.get("exit_status", 0):
+        errors.append("exit status %d instead of %d: %s"%(result.returncode, stage.get("exit_status", 0),
+                                                          result.stderr.decode().strip()))
+    if t > budget:
+        errors.append("took %.2fs, more than its budget of %.0fs"%(t, budget))
+
+    compared = [(output, expected, _read_bytes, _write_bytes) for output, expected in stage.get("outputs", {}).items()]
+    compared += [(output, expected, _read_events, _write_events) for output, expected in stage.get("events", {}).items()]
+    for output, expected, read, write in compared:
+        output = os.path.join(workdir, output)
+        expected = os.path.join(corpus, "expected", expected)
+        if not os.path.exists(output):
+            errors.append("%s was not written"%(os.path.basename(output)))
+        elif update:
+            write(expected, read(output))
+        elif read(output) != read(expected):
+            errors.append("%s differs from %s"%(os.path.basename(output), expected))
+
+    if "stdout" in stage:
+        expected = os.path.join(corpus, "expected", stage["stdout"])
+        if update:
+            _write_bytes(expected, result.stdout)
+        elif result.stdout != _read_bytes(expected):
+            errors.append("the output differs from %s"%(expected))
+
+    return errors
+
+
+def _read_bytes(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def _write_bytes(filename, data):
+    with open(filename, "wb") as f:
+        f.write(data)
+
+
+def _read_events(filename):
+    with open(filename, "r") as f:
+        return [tuple(json.loads(line)[k] for k in EVENT_FIELDS) for line in f]
+
+
+def _write_events(filename, events):
+    with open(filename, "w") as f:
+        for event in events:
+            f.write(json.dumps(dict(zip(EVENT_FIELDS, event)), sort_keys=True))
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,14 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
+import atexit
+import concurrent.futures
+import json
+import os
+import queue
+import threading
 import pari_light_interface
+import pointcount
 import gmpy2
 
 FIRST_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97, 101,
@@ -35,9 +42,195 @@ FIRST_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59,
                 1423, 1427, 1429, 1433, 1439, 1447, 1451, 1453, 1459, 1471, 1481, 1483, 1487, 1489, 1493, 1499, 1511,
                 1523, 1531, 1543, 1549, 1553, 1559, 1567, 1571, 1579, 1583, 1597, 1601, 1607, 1609, 1613, 1619]
 
+PARI_STACK_SIZE       = 8000000    # Initial size of the PARI stack (in bytes)
+PARI_STACK_SIZE_MAX   = 1000000000 # The PARI stack doubles when it overflows, up to this size (in bytes)
+PARI_STACK_SIZE_FIXED = 100000000  # Size of the PARI stack when it cannot grow (PARI < 2.9), unless PARI_STACK_SIZE is
+                                   # larger or PARI_STACK_SIZE_MAX smaller
+
+SMALL_FIELD_LIMIT = 2**64 # Below this prime, points are counted in Python, which is faster than calling SEA
+
+# Cache of the results of pari_probe(), which otherwise needs to start PARI
+PARI_PROBE_CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                "mdcurve", "pari_probe.json")
+
+_pari_nbthreads = None # Number of threads used by the MT engine of PARI (None means the default of PARI)
+_pari_started = False  # PARI is started on the first call, and then kept for the whole life of the process
+_pari_stack_peak_size = 0
+_pari_stack_lock = threading.Lock() # Guards _pari_stack_peak_size, which the threads of PariThreadPool update
+_pari_thread_pools = 0 # Number of running PariThreadPool, which need the MT engine of PARI to use one thread
+
+def set_pari_threads(n):
+    """Set the number of threads that PARI may use for its parallel functions (e.g. the Elkies/Atkin primes in SEA).
+    This only has an effect when libpari was built with an MT engine (e.g. pthread).
+    """
+    global _pari_nbthreads
+    if _pari_thread_pools and n != 1:
+        raise ValueError("PARI must use one thread while a PariThreadPool is running")
+    if n is not None and pari_light_interface.pari_mt_engine() == "single":
+        if n > 1:
+            raise ValueError("libpari was built without an MT engine, cannot use %d threads"%(n))
+        n = None
+    _pari_nbthreads = n
+    if _pari_started:
+        _pari_apply_nbthreads()
+
+def set_pari_stack(size, size_max=None):
+    """Set the initial size of the PARI stack and the maximal size it may grow to. With a version of PARI that cannot
+    resize its stack (PARI < 2.9), the stack is allocated once, with the larger of size and PARI_STACK_SIZE_FIXED capped
+    at size_max.
+
+    Keyword arguments:
+    size     -- initial size of the stack, in bytes
+    size_max -- maximal size of the stack, in bytes (default is PARI_STACK_SIZE_MAX, and at least size)
+    """
+    global PARI_STACK_SIZE, PARI_STACK_SIZE_MAX
+    if size_max is None:
+        size_max = max(size, PARI_STACK_SIZE_MAX)
+    if size <= 0 or size_max < size:
+        raise ValueError("Invalid PARI stack sizes: %d, %d"%(size, size_max))
+    PARI_STACK_SIZE = size
+    PARI_STACK_SIZE_MAX = size_max
+    if _pari_started:
+        _pari_apply_stack_size()
+
+def pari_stack_peak_size():
+    """Return the largest size, in bytes, allocated to the PARI stack so far. The stack only grows when a computation
+    overflows it, so this bounds the memory used by PARI, which may be much less.
+    """
+    return _pari_stack_peak_size
+
+def record_pari_stats(filename):
+    """Record time and memory statistics of the PARI calls, and write them as JSON to filename when the script exits."""
+    pari_light_interface.pari_stats_enable()
+    atexit.register(pari_light_interface.pari_stats_dump, filename)
+
+def _pari_apply_nbthreads():
+    if _pari_nbthreads is not None:
+        pari_light_interface.pari_mt_close()
+        pari_light_interface.pari_sd_nbthreads(_pari_nbthreads)
+        pari_light_interface.pari_mt_init()
+
+def _pari_apply_stack_size():
+    # Without a resizable stack, PARI keeps the stack it was started with
+    global _pari_stack_peak_size
+    if pari_light_interface.pari_has_resizable_stack():
+        pari_light_interface.pari_paristack_setsize(PARI_STACK_SIZE, PARI_STACK_SIZE_MAX)
+        _pari_stack_peak_size = max(_pari_stack_peak_size, PARI_STACK_SIZE)
+
+def _pari_init():
+    """Start PARI if needed, and return the position of the stack to restore with _pari_close()."""
+    global _pari_started, _pari_stack_peak_size
+    if not _pari_started:
+        if pari_light_interface.pari_has_resizable_stack():
+            pari_light_interface.pari_init(PARI_STACK_SIZE, 0)
+        else:
+            _pari_stack_peak_size = min(max(PARI_STACK_SIZE, PARI_STACK_SIZE_FIXED), PARI_STACK_SIZE_MAX)
+            pari_light_interface.pari_init(_pari_stack_peak_size, 0)
+        _pari_started = True
+        atexit.register(_pari_stop)
+        _pari_apply_stack_size()
+        _pari_apply_nbthreads()
+    return pari_light_interface.pari_get_avma()
+
+def _pari_close(av):
+    """Free everything allocated on the PARI stack since _pari_init() returned av."""
+    global _pari_stack_peak_size
+    size = pari_light_interface.pari_stack_size()
+    if size is not None:
+        with _pari_stack_lock:
+            _pari_stack_peak_size = max(_pari_stack_peak_size, size)
+    pari_light_interface.pari_set_avma(av)
+
+def _pari_stop():
+    global _pari_started
+    if _pari_started:
+        pari_light_interface.pari_close()
+        _pari_started = False
+
+def pari_threads_supported():
+    """Return whether PariThreadPool is available, i.e. whether libpari was built with an MT engine."""
+    return pari_light_interface.pari_has_threads()
+
+class PariThreadPool(concurrent.futures.Executor):
+    """Executor running the functions of this module (e.g. sea_edwards) on threads of this process, each with a private
+    PARI stack of the sizes set by set_pari_stack. ctypes releases the GIL during the calls to PARI, so that the threads
+    count points in parallel, with one Python interpreter and one copy of the modular polynomials of seadata (loaded
+    once by the main thread, then shared read-only) instead of one per process. Requires a libpari with an MT engine.
+    The parallel functions of PARI keep their queues in process-wide variables, so the pool sets the number of threads
+    of PARI to 1 (see set_pari_threads) while it runs.
+    """
+
+    def __init__(self, max_workers):
+        global _pari_thread_pools
+        if not pari_threads_supported():
+            raise pari_light_interface.PariUnsupported("libpari was built without an MT engine, PARI cannot run on "
+                                                       "several threads")
+        set_pari_threads(1)
+        _pari_thread_pools += 1
+        self._shutdown = False
+        self._shutdown_lock = threading.Lock()
+        # Start PARI and load the modular polynomials in the main thread, with a small SEA computation
+        av = _pari_init()
+        _pari_close(av)
+        sea_weierstrass(1, 3, 2**89 - 1)
+        seadata = pari_light_interface.pari_get_seadata()
+        self._queue = queue.SimpleQueue()
+        self._pari_threads = [pari_light_interface.pari_thread_alloc(PARI_STACK_SIZE, PARI_STACK_SIZE_MAX)
+                              for i in range(max_workers)]
+        self._threads = [threading.Thread(target=self._work, args=(t, seadata), daemon=True)
+                         for t in self._pari_threads]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self, t, seadata):
+        pari_light_interface.pari_thread_start(t)
+        if seadata:
+            pari_light_interface.pari_set_seadata(seadata)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            (future, fn, args, kwargs) = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        pari_light_interface.pari_set_seadata(None) # Owned by the main thread
+        pari_light_interface.pari_thread_close()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._shutdown_lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = concurrent.futures.Future()
+            self._queue.put((future, fn, args, kwargs))
+            return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """Stop the threads once the submitted functions are done, and free their PARI stacks (always waiting for them,
+        since their stacks cannot be freed before).
+        """
+        global _pari_thread_pools
+        with self._shutdown_lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        if cancel_futures:
+            while not self._queue.empty():
+                self._queue.get()[0].cancel()
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        for t in self._pari_threads:
+            pari_light_interface.pari_thread_free(t)
+        _pari_thread_pools -= 1
+
 def pari_version():
 
-    pari_light_interface.pari_init(100000000, 0)
+    av = _pari_init()
 
     _v = pari_light_interface.pari_version()
     _x = pari_light_interface.pari_gel(_v, 1)
@@ -47,24 +240,72 @@ def pari_version():
     y = int(pari_light_interface.pari_GENtostr(_y))
     z = int(pari_light_interface.pari_GENtostr(_z))
 
-    pari_light_interface.pari_close()
+    _pari_close(av)
     
     return str("%d.%d.%d"%(x,y,z))
 
 def pari_cfg_datadir():
 
-    pari_light_interface.pari_init(100000000, 0)
+    av = _pari_init()
 
     _s = pari_light_interface.pari_sd_datadir()
     s = str(pari_light_interface.pari_GENtostr(_s).decode('utf-8'))[1:-1]
     
-    pari_light_interface.pari_close()
+    _pari_close(av)
 
     return s
     
+def pari_probe():
+    """Return {"version": pari_version(), "datadir": pari_cfg_datadir()}. The result is cached in PARI_PROBE_CACHE, with
+    the path and modification time of libpari, so that only the first script run with a given libpari loads it and
+    starts PARI for this. The entries are keyed by the environment that selects libpari and its datadir
+    (LD_LIBRARY_PATH, the cache of ldconfig and GP_DATA_DIR), and a hit only costs a stat of the cached library.
+    """
+    environment = {"GP_DATA_DIR": os.environ.get("GP_DATA_DIR"),
+                   "LD_LIBRARY_PATH": os.environ.get("LD_LIBRARY_PATH"),
+                   "ld.so.cache": _mtime("/etc/ld.so.cache")}
+    key = json.dumps(environment, sort_keys=True)
+    try:
+        with open(PARI_PROBE_CACHE, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.get(key)
+    if isinstance(entry, dict) and entry.get("mtime") is not None and _mtime(entry.get("library")) == entry["mtime"]:
+        return entry["probe"]
+    probe = {"version": pari_version(), "datadir": pari_cfg_datadir()}
+    path = pari_light_interface.library_path()
+    if _mtime(path) is None:
+        return probe # Unknown file, nothing to check the cache against
+    cache[key] = {"library": path, "mtime": _mtime(path), "probe": probe}
+    try:
+        os.makedirs(os.path.dirname(PARI_PROBE_CACHE), exist_ok=True)
+        tmp = "%s.%d.tmp"%(PARI_PROBE_CACHE, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp, PARI_PROBE_CACHE)
+    except OSError:
+        pass # The cache is only an optimization, e.g. for read-only home directories
+    return probe
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
 def sea_weierstrass(a, b, p, s=0):
+    """Return the number of points of y^2 = x^3 + a*x + b over Fp. If s > 0, PARI may return 0 as soon as it finds
+    that the cardinality has a prime factor smaller than s (early abort); below SMALL_FIELD_LIMIT, the cardinality is
+    always computed in full.
+    """
+
+    if p < SMALL_FIELD_LIMIT:
+        n = pointcount.ellcard(a, b, p)
+        if n is not None:
+            return n
 
-    pari_light_interface.pari_init(100000000, 0)
+    av = _pari_init()
 
     _a = pari_light_interface.pari_gp_read_str(str(a))
     _b = pari_light_interface.pari_gp_read_str(str(b))
@@ -73,7 +314,7 @@ def sea_weierstrass(a, b, p, s=0):
     _t = pari_light_interface.pari_Fp_ellcard_SEA(_a, _b, _p, s)
     t  = pari_light_interface.pari_GENtostr(_t)
     
-    pari_light_interface.pari_close()
+    _pari_close(av)
     
     return int(t)
 
@@ -82,22 +323,33 @@ def sea_montgomery(A, B, p, s=0):
     return sea_weierstrass(a, b, p, s)
 
 def sea_edwards(a, d, p, s=0):
-    (A,B) = _montgomery_parameters_from_edwards_parameters(a, d, p)
-    return sea_montgomery(A, B, p, s)
+    (a4,a6) = weierstrass_parameters_from_edwards_parameters(a, d, p)
+    if p < SMALL_FIELD_LIMIT:
+        # The cardinality is divisible by 4 if a is a square (the points (+-1/sqrt(a), 0) have order 4), by 2 otherwise
+        n = pointcount.ellcard(a4, a6, p, 4 if gmpy2.legendre(a, p) == 1 else 2)
+        if n is not None:
+            return n
+    return sea_weierstrass(a4, a6, p, s)
+
+def weierstrass_parameters_from_edwards_parameters(a, d, p):
+    """Return the parameters (a4, a6) of the short Weierstrass curve isomorphic to the twisted Edwards curve
+    a*x^2 + y^2 = 1 + d*x^2*y^2 over Fp. This is the composition of the Edwards to Montgomery and Montgomery to
+    Weierstrass maps, simplified so that the only inversion is that of 864:
+    a4 = (3*(a-d)^2 - 4*(a+d)^2) / 48 and a6 = (a+d) * (8*(a+d)^2 - 9*(a-d)^2) / 864.
+    """
+    i864 = gmpy2.invert(864, p)
+    s = a + d
+    t = (a - d)**2
+    return ((3*t - 4*s**2) * 18 * i864 % p, s * (8*s**2 - 9*t) * i864 % p)
 
 def _weierstrass_parameters_from_montgomery_parameters(A, B, p):
     a = ((3 - A**2) * gmpy2.invert(3*B**2, p)) % p
     b = ((2*A**3 - 9*A) * gmpy2.invert(27*B**3, p)) % p
     return (a, b)
 
-def _montgomery_parameters_from_edwards_parameters(a, d, p):
-    A = (2 * (a+d) * gmpy2.invert(a - d, p)) % p
-    B = (4 * gmpy2.invert(a - d, p)) % p
-    return (A, B)
-
 def factor(n):
 
-    pari_light_interface.pari_init(100000000, 0)
+    av = _pari_init()
 
     _n = pari_light_interface.pari_gp_read_str(str(n))
 
@@ -116,10 +368,160 @@ def factor(n):
             assert(p > f[-1][0]) # if this fails, add some code that makes sure f is sorted
         f.append([p, m])
 
-    pari_light_interface.pari_close()
+    _pari_close(av)
     
     return f
 
+def ecm(n, B1, rounds=4):
+    """Return a non trivial factor of the composite n found by ECM, or None (also if PARI has no ECM)."""
+    if not pari_light_interface.pari_has_ecm():
+        return None
+
+    av = _pari_init()
+
+    _n = pari_light_interface.pari_gp_read_str(str(n))
+    _f = pari_light_interface.pari_Z_ECM(_n, rounds, 1, B1)
+    f = int(pari_light_interface.pari_GENtostr(_f)) if _f else None
+
+    _pari_close(av)
+
+    return f
+
+ECPP_MIN = 1 << 64 # PARI's primecert returns no ECPP step below this bound
+
+def ecpp(N):
+    """Return the steps of the ECPP certificate of the prime N >= ECPP_MIN computed by PARI, as a list of dictionaries
+    {"N": N_i, "a": a, "b": b, "t": t, "s": s, "x": x, "y": y} in the format of certificate.py, with N_1 = N and
+    N_{i+1} = (N_i + 1 - t_i) / s_i. The last N_{i+1} is smaller than ECPP_MIN and must be proven otherwise.
+    """
+    assert(N >= ECPP_MIN)
+
+    av = _pari_init()
+
+    _N = pari_light_interface.pari_gp_read_str(str(N))
+    _C = pari_light_interface.pari_primecert(_N, 0)
+
+    steps = []
+    for i in range(1, pari_light_interface.pari_lg(_C)):
+        _step = pari_light_interface.pari_gel(_C, i) # [N, t, s, a4, [x, y]]
+        (n, t, s, a) = [int(pari_light_interface.pari_GENtostr(pari_light_interface.pari_gel(_step, j))) for j in range(1, 5)]
+        _P = pari_light_interface.pari_gel(_step, 5)
+        (x, y) = [int(pari_light_interface.pari_GENtostr(pari_light_interface.pari_gel(_P, j))) for j in range(1, 3)]
+        steps.append({"N": n, "a": a, "b": (y*y - x**3 - a*x) % n, "t": t, "s": s, "x": x, "y": y})
+
+    _pari_close(av)
+
+    return steps
+
+POCKLINGTON_MAX_BASES = 1000 # Bases tried for the witnesses of the factors before giving up
+TRIAL_DIVISION_BOUND = 1 << 16
+ECM_B1 = [2000, 11000] # Bounds of the quick ECM attempts, suited to factors of up to about 15 and 20 digits
+
+def factor_partially(n, target=None, known_primes=()):
+    """Factor n by dividing by the known primes (which must be pseudo-primes), trial division and ECM, without calling
+    the general factorization of PARI. Stop as soon as the factored part F is such that F^2 > target, if target is given.
+    Return (factors, cofactor) with factors the sorted list [[p1,m1],[p2,m2],...] of the pseudo-prime factors found, and
+    cofactor the part of n left unfactored (1 if the factorization is complete, composite and prime to p1, p2, ...
+    otherwise).
+    """
+    found = {}
+    composites = []
+    F = 1
+
+    def divide_out(n, p):
+        nonlocal F
+        while n % p == 0:
+            n //= p
+            found[p] = found.get(p, 0) + 1
+            F *= p
+        return n
+
+    def enough():
+        return target is not None and F * F > target
+
+    for p in known_primes:
+        n = divide_out(n, p)
+    p = 2
+    while p < TRIAL_DIVISION_BOUND and p * p <= n and not enough():
+        n = divide_out(n, p)
+        p = int(gmpy2.next_prime(p))
+    if n > 1:
+        composites.append(n)
+
+    # Split the composites with ECM, with growing bounds, the smallest composites first
+    for B1 in [None] + ECM_B1:
+        remaining = []
+        while composites:
+            c = composites.pop()
+            if deterministic_is_pseudo_prime(c):
+                divide_out(c, c)
+                continue
+            f = ecm(c, B1) if B1 and not enough() else None
+            if f:
+                composites += [f, c // f]
+            else:
+                remaining.append(c)
+        composites = sorted(remaining, reverse=True)
+        if not composites or enough():
+            break
+
+    # The primes found may still divide the composites left, with ECM
+    cofactor = gmpy2.mpz(1)
+    for c in composites:
+        cofactor *= c
+    for p in found:
+        (cofactor, m) = gmpy2.remove(cofactor, p)
+        found[p] += m
+    return ([[p, found[p]] for p in sorted(found)], int(cofactor))
+
+def pocklington_witnesses(N, primes):
+    """Return the dictionary a such that, for each prime p in primes (prime factors of N-1), a[p] is the smallest
+    integer > 1 with a[p]^(N-1) = 1 mod N and gcd(a[p]^((N-1)/p) - 1, N) = 1. Each base is tried against all the factors
+    still without a witness at once, the powers a^((N-1)/p) sharing their exponentiations (see cofactor_powers).
+    Raise ValueError if some p has no witness among the first POCKLINGTON_MAX_BASES bases: about half the bases are
+    witnesses when N and p are prime, while none may be when one of them is composite.
+    """
+    a = {}
+    remaining = list(primes)
+    if not remaining:
+        return a
+    for base in range(2, min(N, POCKLINGTON_MAX_BASES + 2)):
+        powers = cofactor_powers(base, N - 1, remaining, N)
+        if gmpy2.powmod(powers[remaining[0]], remaining[0], N) != 1: # this is base^(N-1)
+            continue
+        for p in remaining:
+            if gmpy2.gcd(powers[p] - 1, N) == 1:
+                a[p] = base
+        remaining = [p for p in primes if p not in a]
+        if not remaining:
+            return a
+    raise ValueError("No Pocklington witness for the factor(s) %s of %d - 1: %d or one of these factors is not prime."
+                     %(", ".join(str(p) for p in remaining), N, N))
+
+def cofactor_powers(a, E, primes, N):
+    """Return the dictionary of the a^(E/p) mod N for the primes p dividing E. Rather than one exponentiation of size E
+    per prime, the primes are split in two halves recursively: the powers for the first half are those of a^(product of
+    the second half), and conversely. This takes O(log(len(primes))) exponentiations of size E.
+    """
+    product = 1
+    for p in primes:
+        product *= p
+    return _cofactor_powers(gmpy2.powmod(a, E // product, N), primes, N)
+
+def _cofactor_powers(b, primes, N):
+    if len(primes) == 1:
+        return {primes[0]: b}
+    half = len(primes) // 2
+    (left, right) = (primes[:half], primes[half:])
+    (left_product, right_product) = (1, 1)
+    for p in left:
+        left_product *= p
+    for p in right:
+        right_product *= p
+    powers = _cofactor_powers(gmpy2.powmod(b, right_product, N), left, N)
+    powers.update(_cofactor_powers(gmpy2.powmod(b, left_product, N), right, N))
+    return powers
+
 def cm_field_discriminant(p, t):
 
     # Compute s^2, the largest square dividing t^2-4p
@@ -151,7 +553,7 @@ def embedding_degree(p, q):
     factors = factor(m)
     for f in factors:
         for i in range(f[1]):
-            if (p^(m // f[0])) % q == 1:
+            if gmpy2.powmod(p, m // f[0], q) == 1:
                 m = m // f[0]
 
     return m
@@ -183,11 +585,60 @@ def is_strong_strong_prime_generator(p):
     p = (p<<1) + 1
     return deterministic_is_pseudo_prime(p)
 
+def edwards_base_point_from_bbs(bbs, d, p):
+    """Return the base point of the Edwards curve x^2 + y^2 = 1 + d*x^2*y^2 over Fp (p = 3 mod 4) drawn from bbs: the
+    first y drawn such that there is a point (x, y), with x a square, gives the base point 4*(x, y), unless it is the
+    identity.
+    """
+    size = gmpy2.bit_length(p)
+    while True:
+    
+        y = bbs.genint(size)
+        u = int((1 - y**2) * gmpy2.invert(1 - d*y**2, p)) % p
+        if gmpy2.legendre(u, p) == -1:
+            continue
+        x = gmpy2.powmod(u, (p+1) // 4, p)
+        (x,y) = add_on_edwards(x, y, x, y, d, p)
+        (x,y) = add_on_edwards(x, y, x, y, d, p)
+        if (x, y) == (0, 1):
+            continue
+
+        assert((x**2 + y**2) % p == (1 + d*x**2*y**2) % p)
+        
+        return (x, y)
+
+def non_square_candidates(ds, p):
+    """Return the list of the indexes i such that 0 < ds[i] < p and ds[i] is not a square modulo p (i.e., the candidates
+    of the block ds that pass the tests 1 and 2 of 04_generate_curve_using_bbs.py), for the blocks of asyncsearch.py. The
+    candidates are still tested one by one with gmpy2.legendre: this is about as fast as the scalar tests of 04, which
+    "benchmark.py legendre" compares with it and checks it against.
+    """
+    legendre = gmpy2.legendre
+    p = gmpy2.mpz(p)
+    return [i for i, d in enumerate(ds) if 0 < d < p and legendre(d, p) == -1]
+
 def add_on_edwards(x1, y1, x2, y2, d, p):
     x = int((x1*y2 + x2*y1) * gmpy2.invert(1+d*x1*x2*y1*y2, p)) % p
     y = int((y1*y2 - x1*x2) * gmpy2.invert(1-d*x1*x2*y1*y2, p)) % p
     return (x,y)
 
+def batch_invert(values, p):
+    """Return the list of the inverses modulo p of all the values, using a single modular inversion (Montgomery's
+    simultaneous inversion trick). All the values must be invertible modulo p.
+    """
+    if not values:
+        return []
+    prefix = [gmpy2.mpz(values[0]) % p] # prefix[i] is the product of values[0], ..., values[i]
+    for v in values[1:]:
+        prefix.append(prefix[-1] * v % p)
+    inv = gmpy2.invert(prefix[-1], p)
+    inverses = [None] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        inverses[i] = inv * prefix[i-1] % p
+        inv = inv * values[i] % p
+    inverses[0] = inv
+    return inverses
+
 def deterministic_is_pseudo_prime(n, k=64):
     assert(k <= len(FIRST_PRIMES))
     if n in FIRST_PRIMES:
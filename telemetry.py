@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import contextlib
+import json
+import time
+import utils
+
+
+class EventWriter:
+    """Write events to a file as JSON lines, through a large buffer so that long searches do not flush every line."""
+
+    def __init__(self, filename, buffer_size=1<<20):
+        self.f = open(filename, "a", buffering=buffer_size)
+
+    def write(self, event):
+        self.f.write(json.dumps(event, sort_keys=True))
+        self.f.write("\n")
+
+    def close(self):
+        self.f.close()
+
+
+class Candidate:
+    """Telemetry of one candidate: the test that rejected it, if any, and the time spent in each stage."""
+
+    def __init__(self, number, d, worker, quiet=False):
+        self.number = number
+        self.d = d
+        self.worker = worker
+        self.quiet = quiet # If True, check() does not print anything, whatever utils.quiet
+        self.rejected_by = None
+        self.durations = {}
+
+    def add_duration(self, stage, duration):
+        self.durations[stage] = self.durations.get(stage, 0) + duration
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_duration(name, time.perf_counter() - t)
+
+    def check(self, test, test_description="", test_number=None):
+        """Same as utils.check, but remember the number of the first test that failed."""
+        passed = bool(test) if self.quiet else utils.check(test, test_description, test_number)
+        if not passed and self.rejected_by is None:
+            self.rejected_by = test_number
+        return test
+
+    def event(self):
+        return {"candidate": self.number,
+                "d": int(self.d),
+                "rejected_by": self.rejected_by,
+                "durations": self.durations,
+                "worker": self.worker,
+                "time": time.time()}
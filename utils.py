@@ -25,6 +25,9 @@ import subroutines
 import gmpy2
 
 
+quiet = False # If True, check() does not print anything
+
+
 def exit_error(s):
     sys.exit("[ERROR] %s"%s)
 
@@ -37,7 +40,24 @@ def colprint(col1,col2 = "",col1_size = 50):
         print(col1)
 
         
+def parse_size(s):
+    """Parse a size in bytes, optionally followed by k, M or G (powers of 1000, as for the defaults of PARI). Raise
+    ValueError if s is not such a size.
+    """
+    units = {"k": 10**3, "K": 10**3, "M": 10**6, "G": 10**9}
+    s = str(s).strip()
+    try:
+        if s and s[-1] in units:
+            return int(s[:-1]) * units[s[-1]]
+        return int(s)
+    except ValueError:
+        raise ValueError("Invalid size: '%s'"%(s)) from None
+
+        
 def check(test, test_description="", test_number=None):
+
+    if quiet:
+        return bool(test)
     
     if test_description != "":
         if test_number != None:
@@ -69,9 +89,16 @@ def test_python_version():
               %(local_python_version, expected_python_version), file=sys.stderr)
 
         
+def warn_if_not_canonical(bbs):
+    """Warn that the outputs are not the canonical ones if bbs outputs several bits per squaring."""
+    if bbs.mode_parameters():
+        print('[WARNING] BBS outputs %d bits per squaring: the results are NOT the canonical ones of MDCurve'
+              %(bbs.bits_per_step), file=sys.stderr)
+
+
 def test_pari_version():
     expected_pari_version = '2.7.4'
-    local_pari_version = subroutines.pari_version()
+    local_pari_version = subroutines.pari_probe()["version"]
     if local_pari_version != expected_pari_version:
         print('[WARNING] You are using version %s of PARI. These scripts have been tested with version %s'
               %(local_pari_version, expected_pari_version), file=sys.stderr)
@@ -79,7 +106,7 @@ def test_pari_version():
         
 def test_pari_seadata():
     """Look for the seadata package for PARI. Exit if it cannot be found."""
-    datadir = subroutines.pari_cfg_datadir()
+    datadir = subroutines.pari_probe()["datadir"]
     seadata_path = os.path.join(datadir,"seadata")
     if not os.path.exists(seadata_path):
         exit_error("Cannot find the seadata.tgz package for PARI. Please install this package in %s. See http://pari.math.u-bordeaux.fr/packages.html."%(datadir))
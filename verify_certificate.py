@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import argparse
+import certificate
+import concurrent.futures
+import os
+import time
+import utils
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="""Check a primality certificate written by 05_prove_primes.py, without
+                                     any factorization. The nodes of the proof tree are checked concurrently.""")
+    parser.add_argument("certificate_file", help="Certificate written by 05_prove_primes.py --certificate.")
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Number of worker processes (default is the number of cores).")
+
+    args = parser.parse_args()
+
+    if args.processes is not None and args.processes < 1:
+        utils.exit_error("The number of processes must be positive.")
+
+    try:
+        (primes, proofs) = certificate.load(args.certificate_file)
+    except (ValueError, KeyError) as e:
+        utils.exit_error("Cannot read the certificate: %s"%(e))
+
+    t = time.perf_counter()
+
+    missing = certificate.missing_nodes(primes, proofs)
+    if missing:
+        utils.exit_error("The certificate does not prove %s."%(", ".join(str(N) for N in missing)))
+
+    numbers = sorted(proofs)
+    processes = args.processes or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        results = list(executor.map(_check_node,
+                                    [(N, proofs[N]) for N in numbers],
+                                    chunksize=max(1, len(numbers) // (4 * processes))))
+    failures = [N for N, success in zip(numbers, results) if not success]
+    for N in failures:
+        print("The %s conditions do not hold for N = %d"%("ECPP" if certificate.is_ecpp(proofs[N]) else "Pocklington", N))
+
+    utils.colprint("Nodes checked:", str(len(numbers)))
+    utils.colprint("Total time:", "%.3fs"%(time.perf_counter() - t))
+    if failures:
+        utils.exit_error("%d node(s) failed."%(len(failures)))
+    for N in primes:
+        print("%d is prime."%(N))
+
+
+def _check_node(job):
+    (N, node) = job
+    return certificate.check_node(N, node)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+# This file is part of Million Dollar Curve
+
+# Copyright (C) 2015, 2016  CryptoExperts
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+
+import argparse
+import bbsengine
+import bbsindex
+import concurrent.futures
+import edwards
+import paramfile
+import time
+import utils
+import subroutines
+import gmpy2
+
+
+def main():
+
+    # Test local versions of libraries
+
+    utils.test_python_version()
+    utils.test_gmpy2_version()
+    utils.test_pari_version()
+    utils.test_pari_seadata()
+
+    # Parse command line arguments
+
+    parser = argparse.ArgumentParser(description="""Independently check all the claims of a curve generated by
+                                     04_generate_curve_using_bbs.py, running the checks concurrently.""")
+    parser.add_argument("input_file",
+                        help="""JSON file containing the BBS parameters and the prime of the underlying field, used as an
+                        input of 04_generate_curve_using_bbs.py (typically, the output of
+                        03_generate_prime_field_using_bbs.py).
+                        """)
+    parser.add_argument("curve_file", help="JSON file containing the curve (the output of 04_generate_curve_using_bbs.py).")
+    parser.add_argument("--bbs_index",
+                        help="""Index of the states of BBS computed from input_file by bbsindex.py, used to jump to the
+                        successful candidate.
+                        """)
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Number of worker processes (default is the number of cores).")
+
+    args = parser.parse_args()
+
+
+    # Read the inputs
+
+    field = paramfile.load(args.input_file)
+    curve = paramfile.load(args.curve_file)
+    data = {k: int(v) for k, v in curve.items()}
+    data["start_bbs"] = {k: int(v) for k, v in field.items() if k.startswith("bbs_")}
+    data["bbs_index"] = args.bbs_index
+
+    if int(field["p"]) != data["p"] or int(field["bbs_p"]) != data["bbs_p"] or int(field["bbs_q"]) != data["bbs_q"]:
+        utils.exit_error("The curve was not generated from %s."%(args.input_file))
+    if args.processes is not None and args.processes < 1:
+        utils.exit_error("The number of processes must be positive.")
+    if args.bbs_index and "bbs_bits_per_step" in data:
+        utils.exit_error("The indexes of bbsindex.py only cover the canonical output of BBS, one bit per squaring.")
+    try:
+        utils.warn_if_not_canonical(bbsengine.from_parameters(data["start_bbs"], data.get("bbs_bits_per_step")))
+    except ValueError as e:
+        utils.exit_error(str(e))
+
+
+    # Run all the checks concurrently
+
+    print("Verifying the curve with d = %d..."%(data["d"]))
+    t = time.perf_counter()
+    failures = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = [executor.submit(_timed_check, check, data) for check in CHECKS]
+        for future in concurrent.futures.as_completed(futures):
+            (description, success, duration) = future.result()
+            utils.colprint("\t%s:"%(description), "%s (%.3fs)"%("Success" if success else "Failure", duration), 80)
+            if not success:
+                failures += 1
+
+    utils.colprint("Total time:", "%.3fs"%(time.perf_counter() - t))
+    if failures:
+        utils.exit_error("%d check(s) failed."%(failures))
+    print("All checks succeeded.")
+
+
+def _timed_check(check, data):
+    t = time.perf_counter()
+    success = check(data)
+    return (check.__doc__, success, time.perf_counter() - t)
+
+
+def check_bbs_parameters(data):
+    """BBS primes are strong strong primes"""
+    return subroutines.is_strong_strong_prime(data["bbs_p"]) and subroutines.is_strong_strong_prime(data["bbs_q"])
+
+
+def check_field(data):
+    """p is a prime congruent to 3 modulo 4"""
+    p = data["p"]
+    return subroutines.deterministic_is_pseudo_prime(p) and p % 4 == 3
+
+
+def _bbs_after_candidate(data, candidate_nbr):
+    """Return the BBS instance that 04_generate_curve_using_bbs.py had after drawing the candidate "candidate_nbr"."""
+    size = gmpy2.bit_length(data["p"])
+    offset = size * (candidate_nbr - 1)
+    if data["bbs_index"]:
+        with bbsindex.BBSIndex(data["bbs_index"]) as index:
+            bbs = index.bbs_at(data["bbs_p"], data["bbs_q"], offset)
+    else:
+        bbs = bbsengine.from_parameters(data["start_bbs"], data.get("bbs_bits_per_step"))
+        bbs.skipbits(offset)
+    if bbs.genint(size) != data["d"]:
+        return None
+    return bbs
+
+
+def check_d(data):
+    """d is drawn from BBS and is not a square"""
+    if _bbs_after_candidate(data, data["candidate_nbr"]) is None:
+        return False
+    return subroutines.non_square_candidates([data["d"]], data["p"]) == [0]
+
+
+def check_base_point(data):
+    """Base point is drawn from BBS and has order q"""
+    bbs = _bbs_after_candidate(data, data["candidate_nbr"])
+    if bbs is None:
+        return False
+    (x, y) = subroutines.edwards_base_point_from_bbs(bbs, data["d"], data["p"])
+    if (x, y) != (data["base_point_x"], data["base_point_y"]) or bbs.s != data["bbs_s"]:
+        return False
+    curve = edwards.EdwardsCurve(data["d"], data["p"])
+    return curve.has_order(curve.point(x, y), data["cardinality"] >> 2)
+
+
+def check_cardinality(data):
+    """Cardinality (SEA) and trace"""
+    (p, cardinality) = (data["p"], data["cardinality"])
+    return (subroutines.sea_edwards(1, data["d"], p) == cardinality and
+            data["trace"] == p + 1 - cardinality and
+            data["cardinality_twist"] == p + 1 + data["trace"])
+
+
+def check_q(data):
+    """Cardinality / 4 is prime"""
+    cardinality = data["cardinality"]
+    return cardinality % 4 == 0 and subroutines.deterministic_is_pseudo_prime(cardinality >> 2)
+
+
+def check_q_twist(data):
+    """Twist cardinality / 4 is prime"""
+    cardinality_twist = data["cardinality_twist"]
+    return cardinality_twist % 4 == 0 and subroutines.deterministic_is_pseudo_prime(cardinality_twist >> 2)
+
+
+def check_additive_transfer(data):
+    """Curve and twist are safe against additive transfer"""
+    return data["cardinality"] >> 2 != data["p"] and data["cardinality_twist"] >> 2 != data["p"]
+
+
+def check_embedding_degree(data):
+    """Embedding degree of the curve"""
+    q = data["cardinality"] >> 2
+    embedding_degree = _multiplicative_order(data["p"], q)
+    return embedding_degree == data["embedding_degree"] and embedding_degree > (q-1) // 100
+
+
+def check_embedding_degree_twist(data):
+    """Embedding degree of the twist"""
+    q_twist = data["cardinality_twist"] >> 2
+    embedding_degree_twist = _multiplicative_order(data["p"], q_twist)
+    return embedding_degree_twist == data["embedding_degree_twist"] and embedding_degree_twist > (q_twist-1) // 100
+
+
+def _multiplicative_order(p, q):
+    """Return the order of p modulo the prime q, i.e., the smallest m such that p^m = 1 (mod q), computed here rather
+    than by subroutines.embedding_degree so that the claim of 04 is checked independently.
+    """
+    m = q - 1
+    for (f, e) in subroutines.factor(q - 1):
+        for i in range(e):
+            if gmpy2.powmod(p, m // f, q) != 1:
+                break
+            m //= f
+    return m
+
+
+def check_discriminant(data):
+    """Discriminant of the CM field"""
+    D = subroutines.cm_field_discriminant(data["p"], data["trace"])
+    return D == data["discriminant"] and abs(D) >= 2**100
+
+
+# The most expensive checks come first, so that they start as early as possible
+
+CHECKS = [check_cardinality,
+          check_embedding_degree,
+          check_embedding_degree_twist,
+          check_discriminant,
+          check_base_point,
+          check_d,
+          check_q,
+          check_q_twist,
+          check_bbs_parameters,
+          check_field,
+          check_additive_transfer]
+
+
+if __name__ == "__main__":
+    main()